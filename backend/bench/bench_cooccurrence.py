@@ -0,0 +1,55 @@
+# backend/bench/bench_cooccurrence.py
+#
+# Cost of the incremental co-occurrence model (recommender/cooccurrence.py):
+# per-ticket update time (paid once per insert_ticket), cart lookup latency
+# (paid per recommendation), and snapshot save / load.
+# Run from backend/:  python -m bench.bench_cooccurrence
+import os
+import time
+import random
+import tempfile
+
+import numpy as np
+
+from recommender.cooccurrence import CooccurrenceModel
+
+TICKETS = 100_000
+MENU_SIZE = 200
+LOOKUPS = 5_000
+
+
+def synthetic_ticket(rnd, items):
+    # a few popular items plus a long tail, 1-5 lines per ticket
+    return [items[min(int(rnd.paretovariate(1.2)) - 1, len(items) - 1)] for _ in range(rnd.randint(1, 5))]
+
+
+if __name__ == "__main__":
+    rnd = random.Random(0)
+    items = [f"item{i}" for i in range(MENU_SIZE)]
+    tickets = [synthetic_ticket(rnd, items) for _ in range(TICKETS)]
+
+    model = CooccurrenceModel()
+    start = time.perf_counter()
+    for ticket_id, t in enumerate(tickets, start=1):
+        model.add_ticket(ticket_id, t)
+    add_us = (time.perf_counter() - start) / TICKETS * 1e6
+    print(f"update: {add_us:.2f} us per ticket ({TICKETS} tickets)  {model.stats()}")
+
+    carts = [synthetic_ticket(rnd, items) for _ in range(LOOKUPS)]
+    samples = []
+    for cart in carts:
+        start = time.perf_counter()
+        model.complements(cart)
+        samples.append((time.perf_counter() - start) * 1e6)
+    p50, p99 = np.percentile(samples, [50, 99])
+    print(f"lookup: p50 {p50:.1f} us  p99 {p99:.1f} us per cart")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cooccurrence.json")
+        start = time.perf_counter()
+        model.save_snapshot(path, force=True)
+        save_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        CooccurrenceModel().load_snapshot(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"snapshot: save {save_ms:.1f} ms  load {load_ms:.1f} ms  size {os.path.getsize(path) / 1024:.0f} KiB")
@@ -0,0 +1,160 @@
+# backend/bench/bench_cv_batch.py
+#
+# CPU throughput of the SSD path (cv.detector.ssd_blob + one forward pass)
+# at batch sizes 1/4/8/16, i.e. what batching concurrent verifications
+# (cv.jobs) buys per worker. Frames are random 640x480 BGR images.
+#
+# Uses the MobileNet-SSD weights from cv/models when they are present (and
+# this OpenCV build can read Caffe models). Otherwise a stand-in network is
+# generated: a MobileNet-style depthwise-separable conv stack on the same
+# 300x300 input (~0.5 GFLOP/image), written as ONNX in memory, so the
+# numbers show the batching effect, not MobileNet-SSD's absolute speed.
+# Run from backend/:  python -m bench.bench_cv_batch
+import os
+import time
+
+import numpy as np
+
+from cv import detector
+
+BATCH_SIZES = (1, 4, 8, 16)
+IMAGES_PER_RUN = int(os.getenv("BENCH_IMAGES", "96"))
+
+
+# ---------------------------
+# Minimal ONNX (protobuf) writer for the stand-in network
+# ---------------------------
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(num: int, value) -> bytes:
+    if isinstance(value, int):
+        return _varint(num << 3) + _varint(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return _varint((num << 3) | 2) + _varint(len(value)) + value
+
+
+def _tensor(name: str, array: np.ndarray) -> bytes:
+    dims = b"".join(_field(1, d) for d in array.shape)
+    return dims + _field(2, 1) + _field(8, name) + _field(9, array.astype(np.float32).tobytes())
+
+
+def _value_info(name: str, dims) -> bytes:
+    shape = b"".join(
+        _field(1, _field(2, d) if isinstance(d, str) else _field(1, d)) for d in dims
+    )
+    return _field(1, name) + _field(2, _field(1, _field(1, 1) + _field(2, shape)))
+
+
+def _attr_int(name: str, value: int) -> bytes:
+    return _field(1, name) + _field(3, value) + _field(20, 2)
+
+
+def _attr_ints(name: str, values) -> bytes:
+    return _field(1, name) + b"".join(_field(8, v) for v in values) + _field(20, 7)
+
+
+def standin_onnx() -> bytes:
+    rng = np.random.default_rng(0)
+    nodes, inits = [], []
+    prev, channels = "input", 3
+
+    def conv(out_ch, k, stride, group=1):
+        nonlocal prev, channels
+        idx = len(nodes)
+        w = rng.standard_normal((out_ch, channels // group, k, k)).astype(np.float32) * 0.1
+        inits.append(_tensor(f"w{idx}", w))
+        inits.append(_tensor(f"b{idx}", np.zeros(out_ch, np.float32)))
+        attrs = (
+            _attr_ints("kernel_shape", (k, k)), _attr_ints("strides", (stride, stride)),
+            _attr_ints("pads", (k // 2,) * 4), _attr_int("group", group),
+        )
+        nodes.append(
+            _field(1, prev) + _field(1, f"w{idx}") + _field(1, f"b{idx}") + _field(2, f"c{idx}")
+            + _field(3, f"conv{idx}") + _field(4, "Conv")
+            + b"".join(_field(5, a) for a in attrs)
+        )
+        nodes.append(_field(1, f"c{idx}") + _field(2, f"r{idx}") + _field(3, f"relu{idx}") + _field(4, "Relu"))
+        prev, channels = f"r{idx}", out_ch
+
+    conv(32, 3, 2)
+    for out_ch, stride in ((64, 1), (128, 2), (256, 2), (512, 2), (512, 2)):
+        conv(channels, 3, stride, group=channels)  # depthwise
+        conv(out_ch, 1, 1)                          # pointwise
+    conv(126, 1, 1)                                 # detection-head sized output
+
+    graph = (
+        b"".join(_field(1, n) for n in nodes) + _field(2, "standin")
+        + b"".join(_field(5, t) for t in inits)
+        + _field(11, _value_info("input", ("N", 3, 300, 300)))
+        + _field(12, _value_info(prev, ("N", 126, 10, 10)))
+    )
+    return _field(1, 7) + _field(2, "bench") + _field(7, graph) + _field(8, _field(1, "") + _field(2, 11))
+
+
+# ---------------------------
+# Bench
+# ---------------------------
+
+def load_net():
+    cv2 = detector.cv2
+    if (
+        hasattr(cv2.dnn, "readNetFromCaffe")
+        and os.path.exists(detector.SSD_PROTO) and os.path.exists(detector.SSD_MODEL_FILE)
+    ):
+        return "MobileNet-SSD", cv2.dnn.readNetFromCaffe(detector.SSD_PROTO, detector.SSD_MODEL_FILE)
+    model = np.frombuffer(standin_onnx(), dtype=np.uint8)
+    return "stand-in depthwise conv net", cv2.dnn.readNetFromONNX(model)
+
+
+def run(net, frames, batch_size):
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    # warm this input shape
+    net.setInput(detector.ssd_blob(batches[0]))
+    net.forward()
+
+    pre = fwd = 0.0
+    for batch in batches:
+        t0 = time.perf_counter()
+        blob = detector.ssd_blob(batch)
+        t1 = time.perf_counter()
+        net.setInput(blob)
+        net.forward()
+        pre += t1 - t0
+        fwd += time.perf_counter() - t1
+    return pre, fwd, len(batches)
+
+
+def main():
+    detector.init_backends()
+    name, net = load_net()
+    rng = np.random.default_rng(1)
+    n = IMAGES_PER_RUN - IMAGES_PER_RUN % max(BATCH_SIZES)
+    frames = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(n)]
+
+    print(f"model: {name}; {n} frames of 640x480; cpu threads: {detector.cv2.getNumThreads()}")
+    print(f"{'batch':>5} {'img/s':>8} {'ms/batch':>9} {'pre ms/img':>11} {'fwd ms/img':>11} {'speedup':>8}")
+    base = None
+    for b in BATCH_SIZES:
+        pre, fwd, n_batches = run(net, frames, b)
+        rate = n / (pre + fwd)
+        base = base or rate
+        print(
+            f"{b:>5} {rate:>8.1f} {(pre + fwd) / n_batches * 1000:>9.2f} "
+            f"{pre / n * 1000:>11.2f} {fwd / n * 1000:>11.2f} {rate / base:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# backend/bench/bench_db_concurrency.py
+#
+# Shows that a slow write no longer stalls the event loop: another
+# connection holds the SQLite write lock while one /order and a burst of
+# /kds polls hit the app on a single event loop. With blocking DB calls
+# the polls queue behind the order; with run_db they are served meanwhile.
+# Exits non-zero unless the run_db p50 is well below the blocking p50.
+# Run from backend/:  python -m bench.bench_db_concurrency
+import os
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("SMARTSERVE_DB", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+import db
+import main
+
+LOCK_SECONDS = 0.5
+POLLS = 20
+# run_db p50 must be under this fraction of the blocking p50
+MAX_P50_RATIO = 0.5
+
+
+def hold_write_lock(ready: threading.Event):
+    conn = sqlite3.connect(db.DB_FILE)
+    conn.execute("BEGIN IMMEDIATE")
+    ready.set()
+    time.sleep(LOCK_SECONDS)
+    conn.commit()
+    conn.close()
+
+
+async def timed_get(client, url, start):
+    await client.get(url)
+    return time.perf_counter() - start
+
+
+async def scenario(ticket_id: int):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        ready = threading.Event()
+        locker = threading.Thread(target=hold_write_lock, args=(ready,))
+        locker.start()
+        ready.wait()
+
+        # latency is measured from the moment the order is submitted
+        start = time.perf_counter()
+        order = client.post("/order", json={"profile": "bench", "items": ["burger"]})
+        results = await asyncio.gather(
+            order, *(timed_get(client, f"/kds/{ticket_id}", start) for _ in range(POLLS))
+        )
+        polls = list(results[1:])
+        locker.join()
+
+    polls.sort()
+    return polls[len(polls) // 2] * 1000, polls[-1] * 1000
+
+
+async def blocking_run_db(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+if __name__ == "__main__":
+    main.init_database()
+    ticket_id = main.insert_ticket("bench", ["burger"])["id"]
+
+    offloaded = asyncio.run(scenario(ticket_id))
+
+    main.run_db = blocking_run_db
+    blocking = asyncio.run(scenario(ticket_id))
+
+    print(f"write lock held {LOCK_SECONDS * 1000:.0f} ms, {POLLS} concurrent /kds polls")
+    print(f"blocking sqlite in handler:  p50={blocking[0]:7.1f} ms  max={blocking[1]:7.1f} ms")
+    print(f"run_db thread offload:       p50={offloaded[0]:7.1f} ms  max={offloaded[1]:7.1f} ms")
+
+    ok = offloaded[0] < blocking[0] * MAX_P50_RATIO
+    print(f"run_db p50 {'<' if ok else '>='} {MAX_P50_RATIO:.0%} of blocking p50: {'ok' if ok else 'FAIL'}")
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,53 @@
+# backend/bench/bench_menu.py
+#
+# Requests/sec for GET /menu: the old read-parse-encode path vs the cached
+# snapshot (200 and 304). Run from backend/:  python -m bench.bench_menu
+import json
+import time
+
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from menu_cache import MENU_FILE, get_menu_snapshot, etag_matches
+
+N = 2000
+
+
+def build_apps():
+    old = FastAPI()
+
+    @old.get("/menu")
+    async def old_menu():
+        with open(MENU_FILE, "r") as f:
+            return json.load(f)
+
+    new = FastAPI()
+
+    @new.get("/menu")
+    async def new_menu(request: Request):
+        snap = get_menu_snapshot()
+        headers = {"ETag": snap.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), snap.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=snap.body, media_type="application/json", headers=headers)
+
+    return old, new
+
+
+def run(client: TestClient, headers=None) -> float:
+    for _ in range(50):
+        client.get("/menu", headers=headers)
+    start = time.perf_counter()
+    for _ in range(N):
+        client.get("/menu", headers=headers)
+    return N / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    old, new = build_apps()
+    old_c, new_c = TestClient(old), TestClient(new)
+    etag = new_c.get("/menu").headers["etag"]
+
+    print(f"old (disk + json encode): {run(old_c):8.0f} req/s")
+    print(f"snapshot 200:             {run(new_c):8.0f} req/s")
+    print(f"snapshot 304:             {run(new_c, {'If-None-Match': etag}):8.0f} req/s")
@@ -0,0 +1,119 @@
+# backend/bench/bench_microbatch.py
+#
+# /recommend under concurrent load: the old inline call (encode + search on
+# the event loop, one query per forward pass) vs recommender.batcher's
+# MicroBatcher. Requests arrive open-loop (Poisson) at a fixed offered
+# rate; latency is measured from the scheduled arrival, so time spent
+# waiting for a blocked loop counts. Also reports event loop lag (how late
+# a 1 ms ticker wakes up, i.e. how long other handlers would stall).
+#
+# Without sentence-transformers installed the TF-IDF backend is used and a
+# forward-pass cost is modelled on top of it (ENCODE_FIXED_MS per call +
+# ENCODE_PER_QUERY_MS per query, MiniLM-on-CPU ballpark), since batching
+# only pays off when a call has a fixed cost.
+# Run from backend/:  python -m bench.bench_microbatch
+import os
+import time
+import random
+import asyncio
+import tempfile
+
+import numpy as np
+
+os.environ.setdefault("SMARTSERVE_DB", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from recommender import vector_index
+from recommender.batcher import MicroBatcher
+from recommender.vector_recommender import get_recommendations_vector, get_recommendations_vector_batch
+
+OFFERED_RPS = (50, 150, 400, 1000)
+DURATION_S = float(os.getenv("BENCH_DURATION_S", "3"))
+ENCODE_FIXED_MS = float(os.getenv("ENCODE_FIXED_MS", "4"))
+ENCODE_PER_QUERY_MS = float(os.getenv("ENCODE_PER_QUERY_MS", "0.3"))
+MAX_WAITS_MS = (1, 3)
+
+PROFILES = ("returning", "new", "veg", "in_store")
+ITEMS = ("burger", "cheese_burger", "fries", "cola", "salad", "soup")
+
+
+def model_encoder_cost():
+    real = vector_index._encode_uncached
+
+    def encode(queries):
+        time.sleep((ENCODE_FIXED_MS + ENCODE_PER_QUERY_MS * len(queries)) / 1000)
+        return real(queries)
+
+    vector_index._encode_uncached = encode
+
+
+def random_request(rnd):
+    return {
+        "user": "anonymous",
+        "profile": rnd.choice(PROFILES),
+        "timestamp": f"2025-01-01T{rnd.randint(0, 23):02d}:00:00",
+        "context_ticket_items": rnd.sample(ITEMS, rnd.randint(0, 3)),
+    }
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - start) * 1000 - 1)
+
+
+async def run_load(handler, rate):
+    rnd = random.Random(rate)
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    n = int(rate * DURATION_S)
+    arrivals = np.cumsum([rnd.expovariate(rate) for _ in range(n)])
+
+    async def one(req, arrived):
+        await handler(req)
+        latencies.append((time.perf_counter() - arrived) * 1000)
+
+    tick = asyncio.create_task(ticker(lags, stop))
+    start = time.perf_counter()
+    tasks = []
+    for offset in arrivals:
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(random_request(rnd), start + offset)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    p50, p99 = np.percentile(latencies, [50, 99])
+    lag99 = np.percentile(lags, 99) if lags else float("nan")
+    return p50, p99, n / elapsed, lag99
+
+
+async def main():
+    for rate in OFFERED_RPS:
+        async def inline(req):
+            # the old handler: synchronous call inside the async endpoint
+            return get_recommendations_vector(top_k=3, **req)
+
+        p50, p99, rps, lag = await run_load(inline, rate)
+        print(f"offered {rate:<5d} inline            p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  {rps:7.0f} req/s  loop lag p99 {lag:7.2f} ms")
+
+        for wait in MAX_WAITS_MS:
+            batcher = MicroBatcher(lambda reqs: get_recommendations_vector_batch(reqs, top_k=3), max_wait_ms=wait)
+            p50, p99, rps, lag = await run_load(batcher.submit, rate)
+            stats = batcher.stats()
+            await batcher.stop()
+            print(f"offered {rate:<5d} batched wait={wait}ms p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  {rps:7.0f} req/s  loop lag p99 {lag:7.2f} ms  avg batch {stats['avg_batch']}")
+
+
+if __name__ == "__main__":
+    # every request must hit the model, not the query caches
+    vector_index._EMB_CACHE.maxsize = 0
+    vector_index._RESULT_CACHE.maxsize = 0
+    vector_index.build_index()
+    if not vector_index._EMB_METHOD.startswith("sentence"):
+        model_encoder_cost()
+    print(f"backend {vector_index._EMB_METHOD}, modelled encode cost "
+          f"{ENCODE_FIXED_MS} ms + {ENCODE_PER_QUERY_MS} ms/query, {DURATION_S:.0f} s per run")
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+# backend/bench/bench_recommend_batch.py
+#
+# Queries/sec for N single searches vs one batched search of N queries,
+# for every vector backend whose dependencies are installed.
+# Run from backend/:  python -m bench.bench_recommend_batch
+import random
+import time
+
+from recommender import vector_index
+from recommender.vector_index import build_index, search_similar_by_text, search_similar_by_texts
+
+BACKENDS = ("sentence-faiss", "sentence-nn", "tfidf-nn")
+BATCH_SIZES = (1, 8, 32, 128)
+ROUNDS = 5
+
+PROFILES = ("returning", "new", "veg", "in_store")
+ITEMS = ("burger", "cheese_burger", "fries", "cola", "salad", "soup")
+
+
+def make_queries(n: int):
+    rnd = random.Random(n)
+    return [
+        f"profile: {rnd.choice(PROFILES)} | contains: {' '.join(rnd.sample(ITEMS, 2))} | time: 2025-01-01T{rnd.randint(7, 22):02d}:00:00"
+        for _ in range(n)
+    ]
+
+
+def qps(fn, queries) -> float:
+    fn(queries)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(queries)
+    return ROUNDS * len(queries) / (time.perf_counter() - start)
+
+
+def one_by_one(queries):
+    return [search_similar_by_text(q, top_k=3) for q in queries]
+
+
+def batched(queries):
+    return search_similar_by_texts(queries, top_k=3)
+
+
+if __name__ == "__main__":
+    # measure the search itself, not the query caches
+    vector_index._EMB_CACHE.maxsize = 0
+    vector_index._RESULT_CACHE.maxsize = 0
+
+    for backend in BACKENDS:
+        vector_index.VECTOR_BACKEND = backend
+        build_index(force=True)
+        if vector_index._EMB_METHOD != backend:
+            print(f"{backend:15s} skipped (dependencies not installed)")
+            continue
+
+        for n in BATCH_SIZES:
+            queries = make_queries(n)
+            single = qps(one_by_one, queries)
+            batch = qps(batched, queries)
+            print(f"{backend:15s} n={n:4d}  single {single:9.0f} q/s   batched {batch:9.0f} q/s   x{batch / single:5.1f}")
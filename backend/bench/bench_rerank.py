@@ -0,0 +1,87 @@
+# backend/bench/bench_rerank.py
+#
+# Latency budget for the hybrid re-ranker (recommender/reranker.py): time
+# rerank() alone on synthetic candidate sets and fail (exit 1) if the p99
+# per request goes over RERANK_BUDGET_MS. The menu size must not matter,
+# only candidates x features. Users' order history comes from a scratch
+# DB (user_item_stats), so the history cache is part of the measurement.
+# Run from backend/:  python -m bench.bench_rerank
+import os
+import time
+import random
+import tempfile
+
+import numpy as np
+
+os.environ.setdefault("SMARTSERVE_DB", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from db import init_db, transaction, record_user_items
+from recommender.data_loader import MENU
+from recommender.reranker import rerank, RERANK_CANDIDATES
+
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "1.0"))
+MENU_SIZES = (6, 1_000, 10_000)
+CANDIDATES = (RERANK_CANDIDATES, 50)
+BATCHES = (1, 32)
+ROUNDS = 300
+PROFILES = ("veg", "new", "returning")
+USERS = [f"70400{i:05d}" for i in range(500)]
+TAGS = ("main", "hot", "side", "drink", "veg", "light")
+
+
+def synthetic_menu(rnd, n):
+    menu = [dict(it) for it in MENU]
+    for i in range(len(menu), n):
+        menu.append({"id": f"item{i}", "name": f"Item {i}", "tags": rnd.sample(TAGS, rnd.randint(0, 3))})
+    return menu[:n]
+
+
+def synthetic_batch(rnd, menu, n_candidates, batch):
+    candidates, contexts = [], []
+    for _ in range(batch):
+        items = rnd.sample(menu, min(n_candidates, len(menu)))
+        sims = sorted((rnd.random() for _ in items), reverse=True)
+        candidates.append(list(zip(items, sims)))
+        contexts.append({
+            "user": rnd.choice(USERS + ["anonymous"]),
+            "profile": rnd.choice(PROFILES),
+            "timestamp": f"2025-01-01T{rnd.randrange(24):02d}:15:00",
+            "context_ticket_items": rnd.sample(["burger", "salad", "cola"], rnd.randint(0, 2)),
+        })
+    return candidates, contexts
+
+
+def seed_history(rnd):
+    init_db()
+    ids = [it["id"] for it in MENU]
+    with transaction() as cur:
+        for user in USERS:
+            for day in range(rnd.randint(0, 20)):
+                record_user_items(cur, user, rnd.sample(ids, rnd.randint(1, 3)), f"2025-01-{day % 28 + 1:02d}T12:00:00")
+
+
+if __name__ == "__main__":
+    rnd = random.Random(0)
+    seed_history(rnd)
+    over = []
+    for n in MENU_SIZES:
+        menu = synthetic_menu(rnd, n)
+        for c in CANDIDATES:
+            for b in BATCHES:
+                cands, ctxs = synthetic_batch(rnd, menu, c, b)
+                rerank(cands, ctxs, menu)
+                samples = []
+                for _ in range(ROUNDS):
+                    start = time.perf_counter()
+                    rerank(cands, ctxs, menu)
+                    samples.append((time.perf_counter() - start) * 1000 / b)
+                p50, p99 = np.percentile(samples, [50, 99])
+                flag = ""
+                if c == RERANK_CANDIDATES and p99 > RERANK_BUDGET_MS:
+                    over.append((n, c, b))
+                    flag = "  OVER BUDGET"
+                print(f"menu={n:<6d} candidates={c:<3d} batch={b:<3d} per-request p50 {p50:.3f} ms  p99 {p99:.3f} ms{flag}")
+
+    print(f"budget {RERANK_BUDGET_MS} ms p99 per request at {RERANK_CANDIDATES} candidates: "
+          + ("FAIL " + str(over) if over else "ok"))
+    raise SystemExit(1 if over else 0)
@@ -0,0 +1,105 @@
+# backend/bench/bench_rules.py
+#
+# Rule scoring: the per-item Python loop (scalar functions in
+# recommender/rules.py) vs recommender.engine's compiled NumPy path.
+# Checks that both produce identical scores and top-3 for random contexts,
+# then times them on synthetic menus of growing size.
+# Run from backend/:  python -m bench.bench_rules
+import time
+import random
+
+import numpy as np
+
+from recommender.data_loader import MENU
+from recommender.rules import score_by_time, score_by_profile, score_by_history, score_by_inventory
+from recommender.engine import UPSELL_RULES, compiled_rules, score_items, top_k_stable
+from recommender.inventory import InventoryStore
+
+MENU_SIZES = (6, 100, 1_000, 10_000)
+PARITY_CASES = 2_000
+REPEAT = 20
+PROFILES = ("veg", "new", "returning", "guest")
+TAGS = ("main", "hot", "side", "drink", "veg", "light", "dessert")
+
+
+def loop_scores(menu, hour, profile, history, inventory, context_ticket_items):
+    # the engine's original per-item loop
+    scored = []
+    for item in menu:
+        score = 0
+        score += score_by_time(item, hour)
+        score += score_by_profile(item, profile)
+        score += score_by_history(item, history)
+        score += score_by_inventory(item["id"], inventory)
+        if context_ticket_items:
+            for trigger, target, bonus in UPSELL_RULES:
+                if trigger in context_ticket_items and item["id"] == target:
+                    score += bonus
+        scored.append((score, item))
+    return scored
+
+
+def loop_top3(scored):
+    return [it["id"] for _, it in sorted(scored, key=lambda x: x[0], reverse=True)[:3]]
+
+
+def synthetic_menu(rnd, n):
+    menu = [dict(it) for it in MENU]
+    for i in range(len(menu), n):
+        menu.append({"id": f"item{i}", "name": f"Item {i}", "tags": rnd.sample(TAGS, rnd.randint(0, 3))})
+    return menu[:n]
+
+
+def random_context(rnd, menu):
+    ids = [it["id"] for it in menu]
+    pool = ids[:6] + rnd.sample(ids, min(4, len(ids)))
+    return (
+        rnd.randrange(24),
+        rnd.choice(PROFILES),
+        rnd.sample(pool, rnd.randint(0, 3)),
+        {item_id: rnd.random() > 0.2 for item_id in ids},
+        rnd.sample(pool, rnd.randint(0, 3)),
+    )
+
+
+def check_parity(rnd):
+    mismatches = 0
+    for case in range(PARITY_CASES):
+        menu = synthetic_menu(rnd, rnd.choice((6, 40)))
+        args = random_context(rnd, menu)
+        scored = loop_scores(menu, *args)
+        fast = score_items(menu, *args)
+        same_scores = [s for s, _ in scored] == fast.tolist()
+        same_top = loop_top3(scored) == [menu[i]["id"] for i in top_k_stable(fast, 3)]
+        # the re-ranker's candidate-only history lookup
+        rules, rows = compiled_rules(menu), np.array(rnd.sample(range(len(menu)), 5))
+        same_at = (rules.history_scores_at(args[2], rows) == rules.history_scores(args[2])[rows]).all()
+        # the live store's per-version cached inventory vector
+        store = InventoryStore(args[3])
+        same_store = score_items(menu, *args[:3], store, args[4]).tolist() == fast.tolist()
+        if not (same_scores and same_top and same_at and same_store):
+            mismatches += 1
+    print(f"parity: {PARITY_CASES - mismatches}/{PARITY_CASES} random contexts identical")
+    return mismatches == 0
+
+
+def timed(fn) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+if __name__ == "__main__":
+    rnd = random.Random(0)
+    ok = check_parity(rnd)
+
+    for n in MENU_SIZES:
+        menu = synthetic_menu(rnd, n)
+        args = random_context(rnd, menu)
+        loop_ms = timed(lambda: loop_top3(loop_scores(menu, *args)))
+        fast_ms = timed(lambda: top_k_stable(score_items(menu, *args), 3))
+        print(f"menu={n:<6d} loop {loop_ms:8.3f} ms   compiled {fast_ms:8.3f} ms   x{loop_ms / fast_ms:6.1f}")
+
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,58 @@
+# backend/bench/bench_startup.py
+#
+# Cold-start cost of a worker, each run in a fresh interpreter:
+#   import   - `import main`
+#   /menu    - import + app startup until /menu answers
+#   /ready   - until every subsystem reports ready (background warmup)
+# Run from backend/:  python -m bench.bench_startup
+import os
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RUNS = 3
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter() - t0
+
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get("/menu")
+    t_menu = time.perf_counter() - t0
+    t_ready = None
+    while time.perf_counter() - t0 < 120:
+        r = client.get("/ready")
+        if r.status_code == 200:
+            t_ready = time.perf_counter() - t0
+            break
+        if r.status_code == 404:
+            break
+        time.sleep(0.01)
+
+print(json.dumps({"import": t_import, "menu": t_menu, "ready": t_ready}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ, SMARTSERVE_DB=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    runs = [run_once() for _ in range(RUNS)]
+    for key in ("import", "menu", "ready"):
+        values = [r[key] for r in runs if r[key] is not None]
+        if values:
+            print(f"{key:7s} median {statistics.median(values) * 1000:8.1f} ms")
+        else:
+            print(f"{key:7s} n/a")
@@ -0,0 +1,58 @@
+# backend/bench/bench_topk.py
+#
+# Exact cosine top-k: the old sklearn NearestNeighbors.kneighbors path vs
+# vector_index.TopKIndex (one matmul + argpartition), on synthetic dense
+# (sentence-embedding sized) and sparse (TF-IDF) item matrices.
+# Run from backend/:  python -m bench.bench_topk
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.neighbors import NearestNeighbors
+
+from recommender.vector_index import TopKIndex
+
+ITEM_COUNTS = (100, 1_000, 10_000)
+BATCHES = (1, 32)
+DIM = 384
+K = 10
+REPEAT = 20
+
+
+def timed(fn) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def synthetic_text(rng, n):
+    vocab = [f"w{i}" for i in range(2000)]
+    return [" ".join(rng.choice(vocab, size=8)) for _ in range(n)]
+
+
+def compare(label, items, queries):
+    nn = NearestNeighbors(n_neighbors=K, metric="cosine").fit(items)
+    engine = TopKIndex(items)
+
+    old_ms = timed(lambda: nn.kneighbors(queries, n_neighbors=K))
+    new_ms = timed(lambda: engine.search(queries, K))
+
+    old_idx = nn.kneighbors(queries, n_neighbors=K)[1]
+    new_idx = engine.search(queries, K)[0]
+    agree = np.mean([len(set(a) & set(b)) / K for a, b in zip(old_idx, new_idx)])
+
+    print(f"{label:28s} sklearn {old_ms:8.2f} ms   topk {new_ms:8.2f} ms   x{old_ms / new_ms:6.1f}   overlap {agree:.2f}")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for n in ITEM_COUNTS:
+        items = rng.standard_normal((n, DIM)).astype("float32")
+        corpus = synthetic_text(rng, n)
+        vect = TfidfVectorizer(max_features=512)
+        X = vect.fit_transform(corpus)
+        for b in BATCHES:
+            compare(f"dense  n={n:<6d} batch={b:<3d}", items, rng.standard_normal((b, DIM)).astype("float32"))
+            compare(f"tfidf  n={n:<6d} batch={b:<3d}", X, vect.transform(synthetic_text(rng, b)))
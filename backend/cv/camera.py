@@ -0,0 +1,454 @@
+# cv/camera.py
+#
+# Continuous verification from the pass-through camera. A stream reads
+# frames from a recorded clip (video file / directory of frames), an MJPEG
+# or RTSP URL, samples them down to CAMERA_SAMPLE_FPS and runs a cheap
+# frame-difference gate on a tiny grayscale thumbnail. Only frames where
+# the tray changed go to detection, so CPU follows tray activity rather
+# than the camera's frame rate. Detections are kept per ticket over time.
+
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict, deque
+from datetime import datetime
+from urllib.parse import urlsplit
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from logging_config.logger import get_logger
+cvlog = get_logger("cv")
+
+# frames considered per second of source time; the rest are skipped undecoded
+CAMERA_SAMPLE_FPS = float(os.getenv("CAMERA_SAMPLE_FPS", "5"))
+# frame rate assumed for frame directories and sources that don't report one
+CAMERA_DEFAULT_FPS = float(os.getenv("CAMERA_DEFAULT_FPS", "25"))
+# motion gate: a thumbnail pixel "changed" if it moved by more than
+# CAMERA_PIXEL_DELTA grey levels; a frame changed if CAMERA_MIN_CHANGED of them did
+CAMERA_PIXEL_DELTA = int(os.getenv("CAMERA_PIXEL_DELTA", "25"))
+CAMERA_MIN_CHANGED = float(os.getenv("CAMERA_MIN_CHANGED", "0.02"))
+CAMERA_THUMB_SIZE = (64, 48)
+# re-check a static tray this often anyway (0 = never)
+CAMERA_KEYFRAME_SECONDS = float(os.getenv("CAMERA_KEYFRAME_SECONDS", "0"))
+# local clips must live under this directory
+CAMERA_MEDIA_DIR = os.getenv("CAMERA_MEDIA_DIR", "cv/media")
+CAMERA_URL_SCHEMES = ("http://", "https://", "rtsp://")
+# camera URLs that may be opened: comma-separated full URLs or hosts
+# ("cam1.local", "10.0.0.5:8080"); empty means no network sources
+CAMERA_ALLOWED_SOURCES = [
+    s.strip() for s in os.getenv("CAMERA_ALLOWED_SOURCES", "").split(",") if s.strip()
+]
+# detections kept per ticket, and tickets kept
+CAMERA_TIMELINE_SIZE = int(os.getenv("CAMERA_TIMELINE_SIZE", "100"))
+CAMERA_MAX_TICKETS = int(os.getenv("CAMERA_MAX_TICKETS", "500"))
+MAX_CAMERA_STREAMS = int(os.getenv("MAX_CAMERA_STREAMS", "4"))
+# finished / failed / stopped streams stay listed this long
+CAMERA_STREAM_TTL_SECONDS = float(os.getenv("CAMERA_STREAM_TTL_SECONDS", "600"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# ---------------------------
+# Frame sources
+# ---------------------------
+
+class DirectorySource:
+    """Frames from image files in name order (a recorded clip exported as stills)."""
+
+    def __init__(self, paths: List[str], fps: float = CAMERA_DEFAULT_FPS):
+        self.paths = paths
+        self.fps = fps
+        self.index = 0
+
+    def next(self, skip: int) -> Optional[Tuple[int, float, np.ndarray]]:
+        import cv2
+
+        self.index += skip
+        while self.index < len(self.paths):
+            frame = cv2.imread(self.paths[self.index])
+            index = self.index
+            self.index += 1
+            if frame is not None:
+                return index, index / self.fps, frame
+            cvlog.warning("Unreadable camera frame", extra={"path": self.paths[index]})
+        return None
+
+    def rewind(self):
+        self.index = 0
+
+    def close(self):
+        pass
+
+
+class CaptureSource:
+    """Video file or MJPEG / RTSP stream through cv2.VideoCapture."""
+
+    def __init__(self, uri: str):
+        import cv2
+
+        self.uri = uri
+        self.live = uri.startswith(CAMERA_URL_SCHEMES)
+        self.cap = cv2.VideoCapture(uri)
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open camera source {uri}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or CAMERA_DEFAULT_FPS
+        self.index = -1
+
+    def next(self, skip: int) -> Optional[Tuple[int, float, np.ndarray]]:
+        # grab() reads a frame without decoding it; only sampled frames are retrieved
+        for _ in range(skip):
+            if not self.cap.grab():
+                return None
+            self.index += 1
+        ok, frame = self.cap.read()
+        if not ok:
+            return None
+        self.index += 1
+        return self.index, self.index / self.fps, frame
+
+    def rewind(self):
+        import cv2
+
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.index = -1
+
+    def close(self):
+        self.cap.release()
+
+
+def url_allowed(url: str, allowed: List[str] = CAMERA_ALLOWED_SOURCES) -> bool:
+    """Exact URL match, or the URL's host (with or without port) is listed."""
+    parts = urlsplit(url)
+    try:
+        netloc = f"{parts.hostname}:{parts.port}" if parts.port else parts.hostname
+    except ValueError:
+        return False
+    return url in allowed or parts.hostname in allowed or netloc in allowed
+
+
+def open_source(source: str, fps: Optional[float] = None):
+    """
+    DirectorySource for a frame directory or a single image, CaptureSource
+    for a video file or stream URL. Local paths must be inside
+    CAMERA_MEDIA_DIR, URLs listed in CAMERA_ALLOWED_SOURCES.
+    """
+    if source.startswith(CAMERA_URL_SCHEMES):
+        if not url_allowed(source):
+            raise ValueError(f"Camera URL {source} is not in CAMERA_ALLOWED_SOURCES")
+        return CaptureSource(source)
+
+    root = os.path.realpath(CAMERA_MEDIA_DIR)
+    path = os.path.realpath(os.path.join(root, source))
+    if os.path.commonpath([root, path]) != root or not os.path.exists(path):
+        raise ValueError(f"Camera source {source} not found under {CAMERA_MEDIA_DIR}")
+
+    if os.path.isdir(path):
+        paths = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not paths:
+            raise ValueError(f"No frames in {source}")
+        return DirectorySource(paths, fps or CAMERA_DEFAULT_FPS)
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        return DirectorySource([path], fps or CAMERA_DEFAULT_FPS)
+    return CaptureSource(path)
+
+
+# ---------------------------
+# Motion gate
+# ---------------------------
+
+class MotionGate:
+    """
+    Compares a blurred grayscale thumbnail of each frame with the last
+    frame that was sent to detection, so slow drift still adds up to a
+    change. Costs a resize of the frame, nothing at full resolution.
+    """
+
+    def __init__(self, pixel_delta: int = CAMERA_PIXEL_DELTA, min_changed: float = CAMERA_MIN_CHANGED):
+        self.pixel_delta = pixel_delta
+        self.min_changed = min_changed
+        self.reference: Optional[np.ndarray] = None
+
+    @staticmethod
+    def thumbnail(frame: np.ndarray) -> np.ndarray:
+        import cv2
+
+        small = cv2.resize(frame, CAMERA_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def score(self, thumb: np.ndarray) -> float:
+        """Fraction of thumbnail pixels that changed vs the reference (1.0 without one)."""
+        import cv2
+
+        if self.reference is None:
+            return 1.0
+        return float(np.count_nonzero(cv2.absdiff(thumb, self.reference) > self.pixel_delta)) / thumb.size
+
+    def changed(self, score: float) -> bool:
+        return score >= self.min_changed
+
+    def accept(self, thumb: np.ndarray):
+        self.reference = thumb
+
+
+# ---------------------------
+# Per-ticket detections over time
+# ---------------------------
+
+class CameraTimeline:
+    """ticket id -> recent camera detections, oldest first; least recently updated tickets are dropped."""
+
+    def __init__(self, size: int = CAMERA_TIMELINE_SIZE, max_tickets: int = CAMERA_MAX_TICKETS):
+        self.size = size
+        self.max_tickets = max_tickets
+        self._tickets: "OrderedDict[int, deque]" = OrderedDict()
+
+    def add(self, ticket_id: int, entry: Dict[str, Any]):
+        events = self._tickets.pop(ticket_id, None)
+        if events is None:
+            events = deque(maxlen=self.size)
+        events.append(entry)
+        self._tickets[ticket_id] = events
+        while len(self._tickets) > self.max_tickets:
+            self._tickets.popitem(last=False)
+
+    def get(self, ticket_id: int) -> List[Dict[str, Any]]:
+        return list(self._tickets.get(ticket_id, ()))
+
+
+camera_timeline = CameraTimeline()
+
+
+# ---------------------------
+# Streams
+# ---------------------------
+
+# detect(ticket_id, frame) -> verification result; raises when detection is refused (busy)
+DetectFn = Callable[[int, np.ndarray], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class CameraStream:
+    """
+    One ingest loop. Frame reads and the motion gate run on a thread; a
+    changed frame is handed to detect() for the ticket currently at the
+    pass. At most one detection per stream is in flight: changed frames
+    arriving meanwhile are counted as busy and only the latest of them is
+    checked once detection is free, so the final state of the tray is
+    always seen without queueing a backlog of stale frames.
+    """
+
+    def __init__(self, source_name: str, source, detect: DetectFn, ticket_id: Optional[int] = None,
+                 sample_fps: float = CAMERA_SAMPLE_FPS, realtime: bool = True, loop: bool = False,
+                 timeline: CameraTimeline = camera_timeline):
+        self.id = uuid.uuid4().hex[:12]
+        self.source_name = source_name
+        self.source = source
+        self.detect = detect
+        self.ticket_id = ticket_id
+        self.sample_fps = sample_fps
+        self.realtime = realtime and not getattr(self.source, "live", False)
+        self.loop = loop
+        self.timeline = timeline
+        self.gate = MotionGate()
+        self.state = "running"
+        self.error: Optional[str] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._latest: Optional[tuple] = None
+        self._last_detect_t: Optional[float] = None
+        self.counts = {"read": 0, "skipped": 0, "static": 0, "detected": 0, "busy": 0, "no_ticket": 0, "failed": 0}
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._inflight is not None:
+            self._inflight.cancel()
+        if self.state == "running":
+            self.state = "stopped"
+            self.finished_at = time.time()
+
+    def set_ticket(self, ticket_id: Optional[int]):
+        """A new tray at the pass: its first frame is always checked."""
+        self.ticket_id = ticket_id
+        self.gate.reference = None
+
+    def _skip(self) -> int:
+        """Source frames to pass over between two sampled frames."""
+        if self.sample_fps <= 0:
+            return 0
+        return max(0, int(round(self.source.fps / self.sample_fps)) - 1)
+
+    def _read(self, skip: int):
+        item = self.source.next(skip)
+        if item is None:
+            return None
+        index, t, frame = item
+        thumb = self.gate.thumbnail(frame)
+        return index, t, frame, thumb, self.gate.score(thumb)
+
+    async def _run(self):
+        started = time.monotonic()
+        skip, first = self._skip(), True
+        try:
+            while True:
+                item = await asyncio.to_thread(self._read, 0 if first else skip)
+                if item is None:
+                    if not self.loop or getattr(self.source, "live", False):
+                        break
+                    await asyncio.to_thread(self.source.rewind)
+                    started, first = time.monotonic(), True
+                    continue
+                index, t, frame, thumb, score = item
+                self.counts["read"] += 1
+                self.counts["skipped"] += 0 if first else skip
+                first = False
+
+                if self.realtime:
+                    # play recorded clips at their own pace
+                    delay = t - (time.monotonic() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                keyframe = (
+                    CAMERA_KEYFRAME_SECONDS > 0 and self._last_detect_t is not None
+                    and t - self._last_detect_t >= CAMERA_KEYFRAME_SECONDS
+                )
+                if not (self.gate.changed(score) or keyframe):
+                    self.counts["static"] += 1
+                    continue
+                if self.ticket_id is None:
+                    self.counts["no_ticket"] += 1
+                    continue
+
+                self.gate.accept(thumb)
+                self._last_detect_t = t
+                frame_item = (self.ticket_id, index, t, score, frame)
+                if self._inflight is not None and not self._inflight.done():
+                    self.counts["busy"] += 1
+                    self._latest = frame_item
+                    continue
+                self._inflight = asyncio.get_running_loop().create_task(self._detect_latest(frame_item))
+
+            if self._inflight is not None:
+                await self._inflight
+            self.state = "finished"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            cvlog.error("Camera stream failed", extra={"stream": self.id, "source": self.source_name, "error": str(e)})
+        finally:
+            if self.state != "running":
+                self.finished_at = time.time()
+            await asyncio.to_thread(self.source.close)
+
+    async def _detect_latest(self, frame_item: tuple):
+        while frame_item is not None:
+            await self._detect(*frame_item)
+            frame_item, self._latest = self._latest, None
+
+    async def _detect(self, ticket_id: int, index: int, t: float, score: float, frame: np.ndarray):
+        try:
+            result = await self.detect(ticket_id, frame)
+        except Exception as e:
+            # refused (queue full) or failed: forget the reference so the frame is retried
+            self.counts["failed"] += 1
+            self.gate.reference = None
+            cvlog.warning("Camera frame detection failed", extra={"stream": self.id, "ticket_id": ticket_id, "error": str(e)})
+            return
+        if result is None:
+            return
+
+        self.counts["detected"] += 1
+        self.timeline.add(ticket_id, {
+            "at": datetime.utcnow().isoformat(),
+            "stream": self.id,
+            "frame": index,
+            "t": round(t, 3),
+            "motion": round(score, 4),
+            "detected": result.get("detected", []),
+            "status": result.get("status"),
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "source": self.source_name,
+            "ticketId": self.ticket_id,
+            "state": self.state,
+            "error": self.error,
+            "sample_fps": self.sample_fps,
+            "source_fps": round(self.source.fps, 2),
+            "frames": dict(self.counts),
+        }
+
+
+class CameraStreams:
+    """
+    Streams by id, capped at MAX_CAMERA_STREAMS running; streams that ended
+    stay readable for ttl_seconds and are then dropped.
+    """
+
+    def __init__(self, max_streams: int = MAX_CAMERA_STREAMS, ttl_seconds: float = CAMERA_STREAM_TTL_SECONDS):
+        self.max_streams = max_streams
+        self.ttl = ttl_seconds
+        self._streams: Dict[str, CameraStream] = {}
+        # starts whose source is still opening; they hold a slot meanwhile
+        self._opening = 0
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for stream_id in list(self._streams):
+            finished_at = self._streams[stream_id].finished_at
+            if finished_at is not None and finished_at <= cutoff:
+                del self._streams[stream_id]
+
+    async def start(self, source: str, detect: DetectFn, fps: Optional[float] = None, **options) -> CameraStream:
+        """Opens the source (off the loop; stream URLs can take a while) and starts ingesting."""
+        self._prune()
+        active = sum(1 for s in self._streams.values() if s.state == "running") + self._opening
+        if active >= self.max_streams:
+            raise ValueError(f"{active} camera streams already running")
+        self._opening += 1
+        try:
+            opened = await asyncio.to_thread(open_source, source, fps)
+            stream = CameraStream(source, opened, detect, **options)
+            self._streams[stream.id] = stream
+            stream.start()
+        finally:
+            self._opening -= 1
+        cvlog.info("Camera stream started", extra={"stream": stream.id, "source": source, "ticket_id": stream.ticket_id})
+        return stream
+
+    def get(self, stream_id: str) -> Optional[CameraStream]:
+        self._prune()
+        return self._streams.get(stream_id)
+
+    async def stop(self, stream_id: str) -> Optional[CameraStream]:
+        stream = self._streams.pop(stream_id, None)
+        if stream is not None:
+            await stream.stop()
+        return stream
+
+    async def stop_all(self):
+        for stream_id in list(self._streams):
+            await self.stop(stream_id)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        self._prune()
+        return [s.stats() for s in self._streams.values()]
@@ -3,23 +3,27 @@ from logging_config.logger import get_logger
 cvlog = get_logger("cv")
 
 import os
-import cv2
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Union
+
 import numpy as np
-from typing import Dict, List, Any
 
-# Try YOLOv8 (best case)
+# detectors take a file path or an already decoded BGR image (see cv/image_io.py)
+ImageInput = Union[str, np.ndarray]
+
+# cv2 / ultralytics are heavy imports; they are loaded by init_backends(),
+# called from the app's background warmup or the first detect_items().
+cv2 = None
+YOLO = None
+
 YOLO_AVAILABLE = False
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-    cvlog.info("YOLOv8 available for CV detection.")
-except Exception as e:
-    cvlog.warning(f"YOLOv8 not available. Falling back. error={e}")
+YOLO_WEIGHTS = "cv/models/food_yolo.pt"
 
 # Try MobileNet-SSD
 SSD_AVAILABLE = False
-SSD_MODEL = None
-SSD_CONFIG = None
 
 SSD_PROTO = "cv/models/MobileNetSSD_deploy.prototxt"
 SSD_MODEL_FILE = "cv/models/MobileNetSSD_deploy.caffemodel"
@@ -31,16 +35,206 @@ SSD_CLASSES = [
     "tvmonitor"
 ]
 
-# Load SSD model if files exist
-if os.path.exists(SSD_PROTO) and os.path.exists(SSD_MODEL_FILE):
-    try:
-        SSD_MODEL = cv2.dnn.readNetFromCaffe(SSD_PROTO, SSD_MODEL_FILE)
-        SSD_AVAILABLE = True
-        cvlog.info("Loaded MobileNet-SSD model successfully.")
-    except Exception as e:
-        cvlog.error(f"Failed to load MobileNet-SSD. error={e}")
-else:
-    cvlog.warning("MobileNet-SSD model files not found. SSD disabled.")
+# samples kept per (backend, stage) for the timing percentiles
+CV_TIMING_WINDOW = int(os.getenv("CV_TIMING_WINDOW", "512"))
+
+_BACKENDS_LOADED = False
+_LOAD_LOCK = threading.Lock()
+
+
+# ---------------------------
+# Per-stage timings
+# ---------------------------
+
+class StageTimings:
+    """Rolling per-(backend, stage) durations: load, warmup, preprocess, forward, postprocess."""
+
+    def __init__(self, window: int = CV_TIMING_WINDOW):
+        self.window = window
+        self._samples: Dict[tuple, deque] = {}
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, backend: str, stage: str, ms: float):
+        key = (backend, stage)
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(ms)
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    @contextmanager
+    def time(self, backend: str, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(backend, stage, (time.perf_counter() - start) * 1000)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for (backend, stage), samples in self._samples.items():
+                ordered = sorted(samples)
+                out.setdefault(backend, {})[stage] = {
+                    "count": self._counts[(backend, stage)],
+                    "last_ms": round(samples[-1], 3),
+                    "p50_ms": round(ordered[len(ordered) // 2], 3),
+                    "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+                }
+        return out
+
+
+timings = StageTimings()
+
+
+# ---------------------------
+# Detector registry
+# ---------------------------
+
+class DetectorRegistry:
+    """
+    One entry per available backend: a factory that builds a model
+    instance and a warmup that runs one dummy inference through it.
+    Each thread gets its own instance on first use (cv2.dnn nets and
+    torch models are not safe to run concurrently); a process pool
+    worker gets its own registry with the module. The first instance is
+    built by init_backends() at startup, so its load and warmup cost
+    never lands on a request.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._warmups: Dict[str, Callable[[Any], None]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.instances: Dict[str, int] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], warmup: Optional[Callable[[Any], None]] = None):
+        with self._lock:
+            self._factories[name] = factory
+            if warmup is not None:
+                self._warmups[name] = warmup
+
+    def available(self, name: str) -> bool:
+        return name in self._factories
+
+    def instance(self, name: str) -> Any:
+        models = getattr(self._local, "models", None)
+        if models is None:
+            models = self._local.models = {}
+        model = models.get(name)
+        if model is None:
+            model = models[name] = self._create(name)
+        return model
+
+    def _create(self, name: str) -> Any:
+        with timings.time(name, "load"):
+            model = self._factories[name]()
+        warmup = self._warmups.get(name)
+        if warmup is not None:
+            with timings.time(name, "warmup"):
+                warmup(model)
+        with self._lock:
+            self.instances[name] = self.instances.get(name, 0) + 1
+        cvlog.info("Detector instance ready", extra={"backend": name, "thread": threading.current_thread().name})
+        return model
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backends": list(self._factories), "instances": dict(self.instances)}
+
+
+registry = DetectorRegistry()
+
+
+def _yolo_factory():
+    return YOLO(YOLO_WEIGHTS)
+
+
+def _yolo_warmup(model):
+    model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+
+
+# weights are read from disk once; per-thread nets are built from these bytes
+_SSD_BUFFERS = None
+
+
+def _ssd_factory():
+    proto, weights = _SSD_BUFFERS
+    return cv2.dnn.readNetFromCaffe(proto, weights)
+
+
+def _ssd_warmup(net):
+    net.setInput(cv2.dnn.blobFromImage(np.zeros((300, 300, 3), dtype=np.uint8), 0.007843, (300, 300), 127.5))
+    net.forward()
+
+
+def init_backends():
+    """
+    Imports the CV libraries, registers every backend whose weights exist
+    and builds + warms one instance of each (idempotent).
+    """
+    global cv2, YOLO, YOLO_AVAILABLE, SSD_AVAILABLE, _SSD_BUFFERS, _BACKENDS_LOADED
+
+    if _BACKENDS_LOADED:
+        return
+
+    with _LOAD_LOCK:
+        if _BACKENDS_LOADED:
+            return
+
+        try:
+            import cv2 as _cv2
+            cv2 = _cv2
+        except Exception as e:
+            cvlog.warning(f"OpenCV not available. error={e}")
+
+        # Try YOLOv8 (best case)
+        try:
+            from ultralytics import YOLO as _YOLO
+            YOLO = _YOLO
+            if os.path.exists(YOLO_WEIGHTS):
+                registry.register("yolo", _yolo_factory, _yolo_warmup)
+                registry.instance("yolo")
+                YOLO_AVAILABLE = True
+                cvlog.info("YOLOv8 available for CV detection.")
+            else:
+                cvlog.warning("YOLOv8 weights not found. YOLO disabled.")
+        except Exception as e:
+            cvlog.warning(f"YOLOv8 not available. Falling back. error={e}")
+
+        # Load SSD model if files exist
+        if cv2 is not None and os.path.exists(SSD_PROTO) and os.path.exists(SSD_MODEL_FILE):
+            try:
+                with open(SSD_PROTO, "rb") as f:
+                    proto = np.frombuffer(f.read(), dtype=np.uint8)
+                with open(SSD_MODEL_FILE, "rb") as f:
+                    weights = np.frombuffer(f.read(), dtype=np.uint8)
+                _SSD_BUFFERS = (proto, weights)
+                registry.register("ssd", _ssd_factory, _ssd_warmup)
+                registry.instance("ssd")
+                SSD_AVAILABLE = True
+                cvlog.info("Loaded MobileNet-SSD model successfully.")
+            except Exception as e:
+                cvlog.error(f"Failed to load MobileNet-SSD. error={e}")
+        else:
+            cvlog.warning("MobileNet-SSD model files not found. SSD disabled.")
+
+        _BACKENDS_LOADED = True
+
+
+def is_ready() -> bool:
+    return _BACKENDS_LOADED
+
+
+def detector_stats() -> Dict[str, Any]:
+    return {**registry.stats(), "timings": timings.stats()}
+
+
+def describe_image(image: ImageInput) -> str:
+    """Log-friendly reference: the path, or the decoded image's shape."""
+    if isinstance(image, np.ndarray):
+        return f"<ndarray {image.shape[1]}x{image.shape[0]}>"
+    return image
 
 # ---------------------------
 # 1. DEMO CLASS MAPPING
@@ -56,63 +250,90 @@ DEMO_ITEMS = {
 # 2. YOLOv8 DETECTION
 # ---------------------------
 
-def detect_yolo(img_path: str) -> List[str]:
-    cvlog.info("Running YOLOv8 detection", extra={"image_path": img_path})
+def detect_yolo_batch(images: List[ImageInput]) -> List[List[str]]:
+    """One predict call for the whole batch; labels per image, in order."""
+    cvlog.info("Running YOLOv8 detection", extra={"batch": len(images)})
+
+    model = registry.instance("yolo")
+    # ultralytics takes paths or BGR ndarrays as-is
+    results = model(list(images), verbose=False)
 
-    model = YOLO("cv/models/food_yolo.pt")
-    results = model(img_path)[0]
+    # ultralytics times its own stages, per image (ms)
+    for stage, key in (("preprocess", "preprocess"), ("forward", "inference"), ("postprocess", "postprocess")):
+        timings.record("yolo", stage, sum(r.speed.get(key, 0.0) for r in results))
 
-    labels = []
-    for box in results.boxes:
-        cls_id = int(box.cls)
-        label = results.names.get(cls_id, "")
-        labels.append(label.lower())
+    batch_labels = []
+    for r in results:
+        labels = []
+        for box in r.boxes:
+            cls_id = int(box.cls)
+            label = r.names.get(cls_id, "")
+            labels.append(label.lower())
+        batch_labels.append(labels)
 
-    cvlog.info("YOLOv8 detection results", extra={"detected": labels})
-    return labels
+    cvlog.info("YOLOv8 detection results", extra={"detected": batch_labels})
+    return batch_labels
+
+
+def detect_yolo(image: ImageInput) -> List[str]:
+    return detect_yolo_batch([image])[0]
 
 # ---------------------------
 # 3. SSD DETECTION
 # ---------------------------
 
-def detect_ssd(img_path: str) -> List[str]:
-    cvlog.info("Running SSD detection", extra={"image_path": img_path})
+def ssd_blob(images: List[np.ndarray]) -> np.ndarray:
+    """(N, 3, 300, 300) input blob for a batch of BGR images."""
+    return cv2.dnn.blobFromImages(
+        [cv2.resize(image, (300, 300)) for image in images],
+        0.007843, (300, 300), 127.5
+    )
+
 
-    image = cv2.imread(img_path)
-    if image is None:
-        cvlog.error("Failed to load image for SSD", extra={"image_path": img_path})
-        return []
+def detect_ssd_batch(images: List[np.ndarray]) -> List[List[str]]:
+    """One forward pass for the whole batch; labels per image, in order."""
+    cvlog.info("Running SSD detection", extra={"batch": len(images)})
 
-    (h, w) = image.shape[:2]
+    net = registry.instance("ssd")
 
-    blob = cv2.dnn.blobFromImage(
-        cv2.resize(image, (300, 300)),
-        0.007843, (300, 300), 127.5
-    )
-    SSD_MODEL.setInput(blob)
-    detections = SSD_MODEL.forward()
+    with timings.time("ssd", "preprocess"):
+        blob = ssd_blob(images)
+
+    with timings.time("ssd", "forward"):
+        net.setInput(blob)
+        detections = net.forward()
 
-    labels = []
-    for i in range(detections.shape[2]):
-        confidence = detections[0, 0, i, 2]
-        if confidence > 0.5:
-            idx = int(detections[0, 0, i, 1])
-            cls = SSD_CLASSES[idx].lower()
+    with timings.time("ssd", "postprocess"):
+        batch_labels = [[] for _ in images]
+        # rows are (image_id, class, confidence, box...); image_id -1 pads the output
+        for i in range(detections.shape[2]):
+            confidence = detections[0, 0, i, 2]
+            image_id = int(detections[0, 0, i, 0])
+            if confidence > 0.5 and 0 <= image_id < len(images):
+                idx = int(detections[0, 0, i, 1])
+                cls = SSD_CLASSES[idx].lower()
 
-            if cls in ["bottle", "cup"]:
-                labels.append("cola")  # Map bottle/cup → drink
+                if cls in ["bottle", "cup"]:
+                    batch_labels[image_id].append("cola")  # Map bottle/cup → drink
 
-    cvlog.info("SSD detection results", extra={"detected": labels})
-    return labels
+    cvlog.info("SSD detection results", extra={"detected": batch_labels})
+    return batch_labels
+
+
+def detect_ssd(image: ImageInput) -> List[str]:
+    loaded = load_image(image)
+    if loaded is None:
+        return []
+    return detect_ssd_batch([loaded])[0]
 
 # ---------------------------
 # 4. MOCK DETECTOR
 # ---------------------------
 
-def detect_mock(img_path: str, sample_hint: str = None) -> List[str]:
+def detect_mock(image: ImageInput, sample_hint: str = None) -> List[str]:
     cvlog.warning(
         "Using MOCK detection",
-        extra={"image_path": img_path, "sample_hint": sample_hint}
+        extra={"image_path": describe_image(image), "sample_hint": sample_hint}
     )
 
     if sample_hint == "fries_missing":
@@ -131,44 +352,68 @@ def detect_mock(img_path: str, sample_hint: str = None) -> List[str]:
 # 5. UNIFIED DETECTION PIPELINE
 # ---------------------------
 
-def detect_items(img_path: str, sample_hint: str = None) -> List[str]:
+def load_image(image: ImageInput) -> Optional[np.ndarray]:
+    if not isinstance(image, str):
+        return image
+    with timings.time("upload", "imread"):
+        loaded = cv2.imread(image)
+    if loaded is None:
+        cvlog.error("Failed to load image", extra={"image_path": image})
+    return loaded
+
+
+def detect_items_batch(images: List[ImageInput], sample_hints: Optional[List[Optional[str]]] = None) -> List[List[str]]:
     """
-    Unified entrypoint with prioritized fallback:
-        1. YOLOv8
-        2. MobileNet SSD
-        3. Mock detection
+    detect_items for several images (e.g. concurrent drive-thru lanes):
+    same fallback order, but YOLO / SSD see the whole batch in one forward
+    pass. Returns labels per image, in order; an unreadable image gets [].
     """
+    sample_hints = sample_hints or [None] * len(images)
 
     cvlog.info(
-        "Image received for CV detection",
-        extra={"image_path": img_path, "hint": sample_hint}
+        "Images received for CV detection",
+        extra={"batch": len(images), "hints": sample_hints}
     )
 
-    # ---- Step 1: YOLOv8 ----
-    if YOLO_AVAILABLE and os.path.exists("cv/models/food_yolo.pt"):
-        try:
-            cvlog.info("Attempting YOLOv8 detection...")
-            return detect_yolo(img_path)
-        except Exception as e:
-            cvlog.error(
-                "YOLOv8 failed, falling back to SSD.",
-                extra={"error": str(e)}
-            )
-
-    # ---- Step 2: SSD ----
-    if SSD_AVAILABLE:
-        try:
-            cvlog.info("Attempting SSD detection...")
-            return detect_ssd(img_path)
-        except Exception as e:
-            cvlog.error(
-                "SSD detection failed, falling back to mock.",
-                extra={"error": str(e)}
-            )
+    init_backends()
+
+    if YOLO_AVAILABLE or SSD_AVAILABLE:
+        loaded = [load_image(image) for image in images]
+        ok = [i for i, image in enumerate(loaded) if image is not None]
+        batch = [loaded[i] for i in ok]
+
+        # ---- Step 1: YOLOv8, Step 2: SSD ----
+        for name, available, detect in (("YOLOv8", YOLO_AVAILABLE, detect_yolo_batch), ("SSD", SSD_AVAILABLE, detect_ssd_batch)):
+            if not available:
+                continue
+            try:
+                cvlog.info(f"Attempting {name} detection...")
+                detected = detect(batch) if batch else []
+                out = [[] for _ in images]
+                for i, labels in zip(ok, detected):
+                    out[i] = labels
+                return out
+            except Exception as e:
+                cvlog.error(
+                    f"{name} detection failed, falling back.",
+                    extra={"error": str(e)}
+                )
 
     # ---- Step 3: Mock fallback ----
     cvlog.warning("All CV models unavailable. Using mock pipeline.")
-    result = detect_mock(img_path, sample_hint)
+    result = [detect_mock(image, hint) for image, hint in zip(images, sample_hints)]
 
     cvlog.info("Mock detection results", extra={"detected": result})
     return result
+
+
+def detect_items(image: ImageInput, sample_hint: str = None) -> List[str]:
+    """
+    Unified entrypoint with prioritized fallback:
+        1. YOLOv8
+        2. MobileNet SSD
+        3. Mock detection
+
+    image is a file path or a decoded BGR ndarray (uploads).
+    """
+    return detect_items_batch([image], [sample_hint])[0]
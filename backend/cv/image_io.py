@@ -0,0 +1,121 @@
+# cv/image_io.py
+#
+# Decoding of uploaded tray photos straight from the request buffer:
+# format + resolution are read from the JPEG/PNG header first (no decode),
+# then cv2.imdecode runs on a NumPy view of the same bytes.
+
+import os
+import struct
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from .detector import timings
+
+# upload limits (a 12 MP phone JPEG is ~3-5 MB)
+VERIFY_MAX_UPLOAD_BYTES = int(os.getenv("VERIFY_MAX_UPLOAD_BYTES", str(8 * 1024 * 1024)))
+VERIFY_MAX_PIXELS = int(os.getenv("VERIFY_MAX_PIXELS", str(4096 * 4096)))
+VERIFY_MAX_SIDE = int(os.getenv("VERIFY_MAX_SIDE", "8192"))
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+# JPEG start-of-frame markers carrying the image size (not DHT/JPG/DAC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageRejected(ValueError):
+    """Upload refused before or during decode; status_code is the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def image_format(buf) -> Optional[str]:
+    head = bytes(buf[:8])
+    if head.startswith(JPEG_MAGIC):
+        return "jpeg"
+    if head.startswith(PNG_MAGIC):
+        return "png"
+    return None
+
+
+def _jpeg_size(buf) -> Optional[Tuple[int, int]]:
+    i, n = 2, len(buf)
+    while i + 4 <= n:
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker == 0xFF:
+            # fill byte
+            i += 1
+            continue
+        if marker in (0x01,) or 0xD0 <= marker <= 0xD9:
+            # standalone markers carry no length
+            i += 2
+            continue
+        (length,) = struct.unpack(">H", bytes(buf[i + 2:i + 4]))
+        if marker in _SOF_MARKERS and i + 9 <= n:
+            height, width = struct.unpack(">HH", bytes(buf[i + 5:i + 9]))
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _png_size(buf) -> Optional[Tuple[int, int]]:
+    if len(buf) < 24 or bytes(buf[12:16]) != b"IHDR":
+        return None
+    return struct.unpack(">II", bytes(buf[16:24]))
+
+
+def image_size(buf, fmt: Optional[str] = None) -> Optional[Tuple[int, int]]:
+    """(width, height) from the file header, without decoding pixels."""
+    fmt = fmt or image_format(buf)
+    if fmt == "jpeg":
+        return _jpeg_size(buf)
+    if fmt == "png":
+        return _png_size(buf)
+    return None
+
+
+def check_image(data: Union[bytes, bytearray, memoryview]) -> Tuple[str, int, int]:
+    """
+    Size / format / resolution checks from the bytes and header alone, so
+    an upload can be refused before it is queued or decoded. Returns
+    (format, width, height).
+    """
+    if len(data) == 0:
+        raise ImageRejected(400, "Empty image")
+    if len(data) > VERIFY_MAX_UPLOAD_BYTES:
+        raise ImageRejected(413, f"Image larger than {VERIFY_MAX_UPLOAD_BYTES} bytes")
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    fmt = image_format(buf)
+    if fmt is None:
+        raise ImageRejected(415, "Only JPEG and PNG images are accepted")
+
+    size = image_size(buf, fmt)
+    if size is None:
+        raise ImageRejected(400, f"Unreadable {fmt} header")
+    width, height = size
+    if width == 0 or height == 0 or max(width, height) > VERIFY_MAX_SIDE or width * height > VERIFY_MAX_PIXELS:
+        raise ImageRejected(413, f"Image resolution {width}x{height} exceeds the limit")
+    return fmt, width, height
+
+
+def decode_image(data: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """
+    Validates and decodes an uploaded JPEG/PNG into a BGR ndarray. The
+    bytes are wrapped (np.frombuffer), not copied; the only allocation is
+    the decoded image itself.
+    """
+    import cv2
+
+    fmt, _, _ = check_image(data)
+    with timings.time("upload", "decode"):
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ImageRejected(400, f"Could not decode {fmt} image")
+    return image
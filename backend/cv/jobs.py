@@ -0,0 +1,323 @@
+# cv/jobs.py
+#
+# Tray verification as background jobs: detection runs on a bounded
+# process pool (one model instance per worker process), so a forward pass
+# never blocks the API's event loop. Submitting returns a job id at once;
+# callers poll or long-poll the job, and the caller-supplied finalize step
+# (compare with the ticket, store the result) runs when detection is done.
+# Jobs that queue up meanwhile (several lanes verifying at once) are sent
+# to a worker together and detected in one batched forward pass.
+
+import os
+import time
+import uuid
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from logging_config.logger import get_logger
+cvlog = get_logger("cv")
+
+from .detector import detect_items_batch, detector_stats, init_backends
+from .image_io import decode_image, ImageRejected
+
+# worker processes running detection
+CV_WORKERS = int(os.getenv("CV_WORKERS", "2"))
+# queued + running jobs; submits beyond this are refused (backpressure)
+CV_MAX_PENDING = int(os.getenv("CV_MAX_PENDING", "16"))
+# finished jobs stay pollable this long
+CV_JOB_TTL_SECONDS = float(os.getenv("CV_JOB_TTL_SECONDS", "600"))
+# a batch is dispatched at MAX_SIZE jobs or MAX_WAIT_MS after its first job.
+# On a CPU-only box a batched forward pass is not faster per image (see
+# bench/bench_cv_batch.py), so by default only jobs that are already
+# queued are batched and no job waits for company; raise both on GPUs /
+# many-core workers where batching pays.
+CV_BATCH_MAX_SIZE = int(os.getenv("CV_BATCH_MAX_SIZE", "4"))
+CV_BATCH_MAX_WAIT_MS = float(os.getenv("CV_BATCH_MAX_WAIT_MS", "0"))
+# "spawn" keeps workers clear of the API process's threads (DB pool, faiss)
+CV_START_METHOD = os.getenv("CV_START_METHOD", "spawn")
+# start() gives up if the workers haven't all loaded the model by then
+CV_WARMUP_TIMEOUT_SECONDS = float(os.getenv("CV_WARMUP_TIMEOUT_SECONDS", "300"))
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when CV_MAX_PENDING jobs are already queued or running."""
+
+
+# ---------------------------
+# Worker side (runs in the pool processes)
+# ---------------------------
+
+# set in each worker by _init_worker; start()'s pings meet here
+_startup_barrier = None
+
+
+def _init_worker(barrier=None):
+    global _startup_barrier
+    _startup_barrier = barrier
+    init_backends()
+
+
+def _ping(timeout: float) -> int:
+    # holds this worker until every worker has a ping, so each gets one
+    if _startup_barrier is not None:
+        _startup_barrier.wait(timeout)
+    return os.getpid()
+
+
+def _worker_stats() -> Dict[str, Any]:
+    return {"pid": os.getpid(), **detector_stats()}
+
+
+def run_verification_batch(images: List[Union[str, bytes, bytearray, np.ndarray]],
+                           sample_hints: List[Optional[str]]) -> List[Dict[str, Any]]:
+    """
+    Decode (uploads) + batched detect inside a worker; a str is an image
+    path, an ndarray an already decoded frame (camera ingest). Returns
+    {"detected": labels} or {"error": reason} per image, so one bad upload
+    does not fail the rest of the batch.
+    """
+    out: List[Optional[Dict[str, Any]]] = [None] * len(images)
+    decoded = []
+    for i, image in enumerate(images):
+        if isinstance(image, (str, np.ndarray)):
+            decoded.append(image)
+            continue
+        try:
+            decoded.append(decode_image(image))
+        except ImageRejected as e:
+            out[i] = {"error": e.detail}
+            decoded.append(None)
+
+    ok = [i for i in range(len(images)) if out[i] is None]
+    detected = detect_items_batch([decoded[i] for i in ok], [sample_hints[i] for i in ok]) if ok else []
+    for i, labels in zip(ok, detected):
+        out[i] = {"detected": labels}
+    return out
+
+
+# ---------------------------
+# API side
+# ---------------------------
+
+class VerificationJobs:
+    """
+    Job table + process pool. Job states: queued -> running -> done |
+    failed. One dispatcher per worker takes whatever jobs are queued (up to
+    CV_BATCH_MAX_SIZE) and runs them as one batch, so batches grow with
+    load and a lone job waits at most CV_BATCH_MAX_WAIT_MS. Only the image
+    bytes travel to the worker and only the labels come back.
+    """
+
+    def __init__(self, workers: int = CV_WORKERS, max_pending: int = CV_MAX_PENDING,
+                 ttl_seconds: float = CV_JOB_TTL_SECONDS, batch_max_size: int = CV_BATCH_MAX_SIZE,
+                 batch_max_wait_ms: float = CV_BATCH_MAX_WAIT_MS):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.ttl = ttl_seconds
+        self.batch_max_size = max(1, batch_max_size)
+        self.batch_max_wait = max(0.0, batch_max_wait_ms) / 1000
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._done: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatchers: List[asyncio.Task] = []
+        self._tasks: set = set()
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.max_batch_seen = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            context = multiprocessing.get_context(CV_START_METHOD)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(context.Barrier(self.workers),),
+            )
+        return self._pool
+
+    def start(self, timeout: float = CV_WARMUP_TIMEOUT_SECONDS):
+        """
+        Starts every worker process and waits until all of them have loaded
+        the model (called off the event loop). The pool only spawns a process
+        when work arrives, so one ping per worker is submitted; the pings
+        wait on a shared barrier, so no worker can answer two of them.
+        """
+        pool = self._executor()
+        pings = [pool.submit(_ping, timeout) for _ in range(self.workers)]
+        pids = {ping.result(timeout) for ping in pings}
+        cvlog.info("Verification workers ready", extra={"workers": len(pids)})
+
+    def _ensure_dispatchers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._dispatchers:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._dispatchers = [loop.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._dispatchers + list(self._tasks):
+            task.cancel()
+        self._dispatchers = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if job["finished_at"] is None or job["finished_at"] > cutoff:
+                continue
+            del self._jobs[job_id]
+            self._done.pop(job_id, None)
+
+    def submit(
+        self,
+        ticket_id: int,
+        image: Union[str, bytes, bytearray, np.ndarray],
+        sample_hint: Optional[str],
+        finalize: Callable[[List[str]], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Queues detection for one ticket and returns the job. finalize(detected)
+        runs on the event loop when detection is done and its return value
+        becomes the job result.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise JobQueueFull(f"{self.pending} verification jobs pending")
+
+        self._ensure_dispatchers()
+        self._prune()
+        job_id = uuid.uuid4().hex
+        job = {
+            "jobId": job_id,
+            "ticketId": ticket_id,
+            "state": "queued",
+            "submitted_at": time.time(),
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        self._jobs[job_id] = job
+        self._done[job_id] = asyncio.Event()
+        self.pending += 1
+        self.submitted += 1
+        self._queue.put_nowait((job, image, sample_hint, finalize))
+        return dict(job)
+
+    async def _collect(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_max_wait
+        while len(batch) < self.batch_max_size:
+            while len(batch) < self.batch_max_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_max_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            for job, *_ in batch:
+                job["state"] = "running"
+            self.batches += 1
+            self.batched_jobs += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+            try:
+                outcomes = await loop.run_in_executor(
+                    self._executor(), run_verification_batch,
+                    [image for _, image, _, _ in batch], [hint for _, _, hint, _ in batch],
+                )
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool) and self._pool is not None:
+                    # a worker died (OOM, native crash); the next batch gets a fresh pool
+                    pool, self._pool = self._pool, None
+                    pool.shutdown(wait=False, cancel_futures=True)
+                outcomes = [{"error": str(e) or type(e).__name__}] * len(batch)
+
+            # storing results hits the DB; don't hold up the next batch for it
+            for (job, _, _, finalize), outcome in zip(batch, outcomes):
+                task = loop.create_task(self._finish(job, finalize, outcome))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _finish(self, job, finalize, outcome: Dict[str, Any]):
+        try:
+            if "error" in outcome:
+                raise RuntimeError(outcome["error"])
+            job["result"] = await finalize(outcome["detected"])
+            job["state"] = "done"
+        except Exception as e:
+            self.failed += 1
+            job["state"] = "failed"
+            job["error"] = str(e) or type(e).__name__
+            cvlog.error("Verification job failed", extra={"job_id": job["jobId"], "ticket_id": job["ticketId"], "error": job["error"]})
+        finally:
+            self.pending -= 1
+            job["finished_at"] = time.time()
+            event = self._done.get(job["jobId"])
+            if event is not None:
+                event.set()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """The job once finished, or as it stands after timeout seconds."""
+        event = self._done.get(job_id)
+        if event is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.get(job_id)
+
+    async def worker_stats(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        """Detector stats of one (any) worker process; None if all are busy past timeout."""
+        if self._pool is None:
+            return None
+        try:
+            return await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(self._pool, _worker_stats), timeout
+            )
+        except (asyncio.TimeoutError, BrokenProcessPool):
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "tracked": len(self._jobs),
+            "batches": self.batches,
+            "avg_batch": round(self.batched_jobs / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "batch_max_size": self.batch_max_size,
+            "batch_max_wait_ms": self.batch_max_wait * 1000,
+        }
@@ -1,36 +1,374 @@
 # backend/db.py
 import sqlite3
 import os
+import json
+import asyncio
+import functools
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-DB_FILE = os.path.join(os.path.dirname(__file__), "smartserve.db")
+from logging_config.logger import get_logger
+log = get_logger("backend")
 
-def get_conn():
-    # check_same_thread False for multi-threaded FastAPI calls
-    return sqlite3.connect(DB_FILE, check_same_thread=False)
+DB_FILE = os.getenv("SMARTSERVE_DB", os.path.join(os.path.dirname(__file__), "smartserve.db"))
 
-def init_db():
+# connection tuning (override via env for tests / other deployments)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+# threads used by run_db(); each keeps its own pooled connection
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "4"))
+# per-user item scores lose half their weight after this many days
+USER_HISTORY_HALF_LIFE_DAYS = float(os.getenv("USER_HISTORY_HALF_LIFE_DAYS", "30"))
+
+# one persistent connection per thread (sqlite3 connections are not
+# safe to share between threads while a statement is in flight)
+_local = threading.local()
+_all_conns = []
+_all_lock = threading.Lock()
+# bumped by close_all() so other threads drop their stale connection
+_generation = 0
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_FILE,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        # compiled statements are reused across calls on this connection
+        cached_statements=DB_STATEMENT_CACHE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.create_function("decay_weight", 2, decay_weight, deterministic=True)
+    return conn
+
+
+def decay_weight(from_at: str, to_at: str) -> float:
+    """Recency decay factor between two ISO timestamps (1.0 if to_at is not later)."""
+    try:
+        days = (datetime.fromisoformat(to_at) - datetime.fromisoformat(from_at)).total_seconds() / 86400
+    except (TypeError, ValueError):
+        return 1.0
+    return 0.5 ** (max(days, 0.0) / USER_HISTORY_HALF_LIFE_DAYS)
+
+
+def get_conn() -> sqlite3.Connection:
+    """
+    Returns this thread's persistent connection, opening it on first use.
+    Callers must NOT close it; use `with conn:` to commit / roll back.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+        with _all_lock:
+            _all_conns.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction(immediate: bool = False):
+    """
+    Yields a cursor inside a single transaction on this thread's connection.
+    immediate=True takes the write lock up front (BEGIN IMMEDIATE) so a
+    read-then-write sequence can't fail halfway with SQLITE_BUSY.
+    """
     conn = get_conn()
     cur = conn.cursor()
-    # tickets table (if not already)
+    if immediate:
+        cur.execute("BEGIN IMMEDIATE")
+    try:
+        yield cur
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Runs a blocking DB helper on the DB thread pool so async handlers
+    don't stall the event loop while SQLite waits on disk or a lock.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+def close_all():
+    """Closes every pooled connection (shutdown / tests)."""
+    global _generation
+    with _all_lock:
+        _generation += 1
+        for conn in _all_conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _all_conns.clear()
+
+
+def ticket_item_rows(ticket_id: int, items):
+    """(ticket_id, item_id, quantity) rows for ticket_items; duplicates are counted."""
+    counts = {}
+    for item_id in items:
+        counts[item_id] = counts.get(item_id, 0) + 1
+    return [(ticket_id, item_id, qty) for item_id, qty in counts.items()]
+
+
+# ---------------------------
+# Schema migrations (tracked in PRAGMA user_version)
+# ---------------------------
+def _migrate_ticket_items(cur):
+    # normalized line items so "open tickets containing X" is an index lookup
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS tickets (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        created_at TEXT,
-        profile TEXT,
-        items TEXT,
-        status TEXT
+    CREATE TABLE IF NOT EXISTS ticket_items (
+        ticket_id INTEGER NOT NULL REFERENCES tickets(id) ON DELETE CASCADE,
+        item_id TEXT NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        PRIMARY KEY (ticket_id, item_id)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ticket_items_item ON ticket_items (item_id, ticket_id)"
+    )
+    # KDS / analytics: status filter + time ordering without touching the table
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tickets_status_created ON tickets (status, created_at, id)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tickets_created ON tickets (created_at)"
+    )
+
+    # backfill from the JSON column of existing smartserve.db files
+    last_id = 0
+    while True:
+        rows = cur.execute(
+            "SELECT id, items FROM tickets WHERE id > ? ORDER BY id LIMIT 5000", (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        batch = []
+        for ticket_id, items in rows:
+            try:
+                parsed = json.loads(items or "[]")
+                if not isinstance(parsed, list):
+                    raise TypeError(f"items is a JSON {type(parsed).__name__}, not a list")
+                batch.extend(ticket_item_rows(ticket_id, parsed))
+            except (ValueError, TypeError) as e:
+                # unreadable items JSON (or dict / number entries): leave that ticket out
+                log.warning("Skipping ticket_items backfill for ticket", extra={"ticket_id": ticket_id, "error": str(e)})
+        cur.executemany(
+            "INSERT OR IGNORE INTO ticket_items (ticket_id, item_id, quantity) VALUES (?, ?, ?)",
+            batch,
+        )
+        last_id = rows[-1][0]
+
+
+def _migrate_status_log(cur):
+    # append-only status history; seq doubles as the KDS delta-sync cursor
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ticket_status_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        ticket_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        changed_at TEXT NOT NULL
     );
     """)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_status_log_ticket ON ticket_status_log (ticket_id, seq)"
+    )
+    # seed with the current status of existing tickets so cursors start consistent
+    cur.execute("""
+    INSERT INTO ticket_status_log (ticket_id, status, changed_at)
+    SELECT id, COALESCE(status, 'created'), COALESCE(created_at, '')
+    FROM tickets ORDER BY id
+    """)
+
+
+def log_status_change(cur, ticket_id: int, status: str, changed_at: str):
+    cur.execute(
+        "INSERT INTO ticket_status_log (ticket_id, status, changed_at) VALUES (?, ?, ?)",
+        (ticket_id, status, changed_at),
+    )
+
 
-    # users table for phone-based login
+def _migrate_verifications(cur):
+    # latest CV verification per ticket (replaces verification_{id}.json files)
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        phone TEXT UNIQUE NOT NULL,
-        name TEXT,
-        profile TEXT
+    CREATE TABLE IF NOT EXISTS ticket_verifications (
+        ticket_id INTEGER PRIMARY KEY REFERENCES tickets(id) ON DELETE CASCADE,
+        result TEXT NOT NULL,
+        verified_at TEXT NOT NULL
     );
     """)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_verifications_at ON ticket_verifications (verified_at)"
+    )
+
+
+def _migrate_user_history(cur):
+    # who placed a ticket (phone / user id; NULL for walk-ins)
+    cur.execute("ALTER TABLE tickets ADD COLUMN user_id TEXT")
+    # per-user aggregates, maintained in the ticket insert transaction;
+    # score is recency-weighted as of last_ordered_at (see record_user_items)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user_item_stats (
+        user_id TEXT NOT NULL,
+        item_id TEXT NOT NULL,
+        order_count INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        last_ordered_at TEXT NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (user_id, item_id)
+    ) WITHOUT ROWID;
+    """)
+
+
+def record_user_items(cur, user_id: str, items, ordered_at: str):
+    """
+    Folds one ticket into user_item_stats: a primary-key upsert per item.
+    The stored score is decayed to the newer of the two timestamps before
+    adding this order, so offline-queued (older) orders count for less.
+    """
+    rows = [
+        (user_id, item_id, qty, ordered_at)
+        for _, item_id, qty in ticket_item_rows(0, items)
+    ]
+    cur.executemany(
+        """
+        INSERT INTO user_item_stats (user_id, item_id, order_count, quantity, last_ordered_at, score)
+        VALUES (?1, ?2, 1, ?3, ?4, 1.0)
+        ON CONFLICT (user_id, item_id) DO UPDATE SET
+            order_count = order_count + 1,
+            quantity = quantity + excluded.quantity,
+            score = score * decay_weight(last_ordered_at, MAX(last_ordered_at, excluded.last_ordered_at))
+                  + decay_weight(excluded.last_ordered_at, MAX(last_ordered_at, excluded.last_ordered_at)),
+            last_ordered_at = MAX(last_ordered_at, excluded.last_ordered_at)
+        """,
+        rows,
+    )
+
+
+def fetch_user_item_stats(user_id: str, limit: int = 20):
+    """A user's items, best recency-weighted score first (PK range scan on user_id)."""
+    now = datetime.utcnow().isoformat()
+    rows = get_conn().execute(
+        """
+        SELECT item_id, order_count, quantity, last_ordered_at,
+               score * decay_weight(last_ordered_at, ?) AS recency
+        FROM user_item_stats
+        WHERE user_id = ?
+        ORDER BY recency DESC, item_id
+        LIMIT ?
+        """,
+        (now, user_id, limit),
+    ).fetchall()
+    return [
+        {
+            "item_id": item_id,
+            "order_count": order_count,
+            "quantity": quantity,
+            "last_ordered_at": last_ordered_at,
+            "score": round(recency, 4),
+        }
+        for item_id, order_count, quantity, last_ordered_at, recency in rows
+    ]
+
+
+# bound parameters per IN (...) list (SQLite's default limit is 999)
+_IN_CHUNK = 500
+
+
+def fetch_user_item_stats_many(user_ids, limit: int = 20):
+    """
+    fetch_user_item_stats for several users in one query per _IN_CHUNK
+    users (PK range reads on user_id; a user has at most one row per menu
+    item, so the per-user limit is applied here). Returns {user_id: rows};
+    users without history map to [].
+    """
+    now = datetime.utcnow().isoformat()
+    user_ids = list(dict.fromkeys(user_ids))
+    out = {user_id: [] for user_id in user_ids}
+    conn = get_conn()
+    for i in range(0, len(user_ids), _IN_CHUNK):
+        chunk = user_ids[i:i + _IN_CHUNK]
+        rows = conn.execute(
+            f"""
+            SELECT user_id, item_id, order_count, quantity, last_ordered_at, recency
+            FROM (
+                SELECT user_id, item_id, order_count, quantity, last_ordered_at,
+                       score * decay_weight(last_ordered_at, ?) AS recency
+                FROM user_item_stats
+                WHERE user_id IN ({",".join("?" * len(chunk))})
+            )
+            ORDER BY user_id, recency DESC, item_id
+            """,
+            (now, *chunk),
+        ).fetchall()
+        for user_id, item_id, order_count, quantity, last_ordered_at, recency in rows:
+            items = out[user_id]
+            if len(items) < limit:
+                items.append({
+                    "item_id": item_id,
+                    "order_count": order_count,
+                    "quantity": quantity,
+                    "last_ordered_at": last_ordered_at,
+                    "score": round(recency, 4),
+                })
+    return out
+
+
+MIGRATIONS = [
+    _migrate_ticket_items,   # user_version 1
+    _migrate_status_log,     # user_version 2
+    _migrate_verifications,  # user_version 3
+    _migrate_user_history,   # user_version 4
+]
+
+
+def migrate():
+    """Applies pending migrations; safe to run from several workers at once."""
+    for version, step in enumerate(MIGRATIONS, start=1):
+        with transaction(immediate=True) as cur:
+            current = cur.execute("PRAGMA user_version").fetchone()[0]
+            if current >= version:
+                continue
+            step(cur)
+            cur.execute(f"PRAGMA user_version = {version}")
+
+
+def init_db():
+    with transaction() as cur:
+        # tickets table (if not already)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT,
+            profile TEXT,
+            items TEXT,
+            status TEXT
+        );
+        """)
+
+        # users table for phone-based login
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone TEXT UNIQUE NOT NULL,
+            name TEXT,
+            profile TEXT
+        );
+        """)
 
-    conn.commit()
-    conn.close()
+    migrate()
@@ -0,0 +1,107 @@
+# backend/events.py
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+# per-screen buffer; a screen that falls this far behind loses its oldest events
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "256"))
+
+
+class Subscription:
+    __slots__ = ("ticket_id", "queue", "dropped")
+
+    def __init__(self, ticket_id: Optional[int]):
+        self.ticket_id = ticket_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class TicketEventBus:
+    """
+    In-process fan-out of ticket status changes to KDS / customer screens.
+
+    Screens subscribe either to every ticket (kitchen) or to one ticket id
+    (customer display). publish() may be called from any thread (DB helpers
+    run on the DB pool); delivery happens on the event loop, touching only
+    the kitchen subscribers plus the watchers of that one ticket.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._all: Set[Subscription] = set()
+        self._by_ticket: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self, ticket_id: Optional[int] = None) -> Subscription:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        sub = Subscription(ticket_id)
+        with self._lock:
+            if ticket_id is None:
+                self._all.add(sub)
+            else:
+                self._by_ticket.setdefault(ticket_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub.ticket_id is None:
+                self._all.discard(sub)
+            else:
+                watchers = self._by_ticket.get(sub.ticket_id)
+                if watchers is not None:
+                    watchers.discard(sub)
+                    if not watchers:
+                        del self._by_ticket[sub.ticket_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._all) + sum(len(s) for s in self._by_ticket.values())
+
+    def publish(self, ticket_id: int, status: str, **fields):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        with self._lock:
+            if not self._all and ticket_id not in self._by_ticket:
+                return
+
+        event = {
+            "ticketId": ticket_id,
+            "status": status,
+            "ts": datetime.utcnow().isoformat(),
+            **fields,
+        }
+        loop.call_soon_threadsafe(self._fanout, event)
+
+    def _fanout(self, event: Dict[str, Any]):
+        with self._lock:
+            targets = list(self._all)
+            targets.extend(self._by_ticket.get(event["ticketId"], ()))
+
+        for sub in targets:
+            q = sub.queue
+            if q.full():
+                # slow screen: drop its oldest event rather than block everyone
+                q.get_nowait()
+                sub.dropped += 1
+            q.put_nowait(event)
+
+
+def sse_format(event: Dict[str, Any], name: str = "ticket") -> str:
+    return f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+ticket_events = TicketEventBus()
@@ -1,28 +1,49 @@
 # backend/main.py
 import os
 import json
+import asyncio
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 
-from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi import FastAPI, HTTPException, Request, Query, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 # logging config
 from logging_config.logger import init_logging, get_logger, CorrelationIdMiddleware
 
 # recommender and cv modules
-from recommender.vector_recommender import get_recommendations_vector
-from cv.detector import detect_items
+from recommender.vector_recommender import get_recommendations_vector_batch
+from recommender.vector_index import cache_stats, build_index
+from recommender.inventory import inventory
+from recommender.cooccurrence import cooccurrence
+from recommender.batcher import MicroBatcher
+from recommender.materialized import MaterializedRecs, MATERIALIZED_PROFILES, STORE_ID
+from recommender.data_loader import (
+    load_user_item_stats, invalidate_user_history, user_history_cache_stats, with_user_histories,
+    load_menu as load_recommender_menu,
+)
+from cv.image_io import check_image, ImageRejected, VERIFY_MAX_UPLOAD_BYTES
+from cv.jobs import VerificationJobs, JobQueueFull
+from cv.camera import CameraStreams, camera_timeline, CAMERA_SAMPLE_FPS
 
 # db helper
-from db import init_db, get_conn, DB_FILE
+from db import (
+    init_db, get_conn, transaction, close_all, run_db,
+    ticket_item_rows, log_status_change, record_user_items,
+)
+
+# menu snapshot (pre-encoded body + ETag, hot reload on file change)
+from menu_cache import get_menu_snapshot, etag_matches
 
-# init logging and DB
+# in-process pub/sub for ticket status push (SSE)
+from events import ticket_events, sse_format
+
+# init logging (DB, recommender and CV are initialised at startup, see warmup below)
 init_logging()
 log = get_logger("backend")
-init_db()
 
 # Add profiles for demo
 def seed_demo_profiles():
@@ -32,30 +53,137 @@ def seed_demo_profiles():
         ("7041313131", "Kids Friendly", "profile_kids"),
     ]
 
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-
-    for phone, name, profile in seed_data:
-        cur.execute(
+    with transaction() as cur:
+        cur.executemany(
             """
             INSERT OR IGNORE INTO users (phone, name, profile)
             VALUES (?, ?, ?)
             """,
-            (phone, name, profile)
+            seed_data
         )
 
-    conn.commit()
-    conn.close()
 
+def init_database():
+    init_db()
+    seed_demo_profiles()
 
-# call immediately when app starts
-seed_demo_profiles()
 
+def init_recommender():
+    load_cooccurrence()
+    build_index()
 
 
 app = FastAPI(title="SmartServe Backend (Hackathon Demo)")
 app.add_middleware(CorrelationIdMiddleware)
 
+
+# ---------------------------
+# Startup: readiness + background warmup
+# ---------------------------
+# per-subsystem state reported by /ready: pending | warming | ready | failed
+READINESS = {"db": "pending", "recommender": "pending", "cv": "pending"}
+
+
+async def warm_subsystem(name: str, fn):
+    READINESS[name] = "warming"
+    try:
+        await asyncio.to_thread(fn)
+        READINESS[name] = "ready"
+        log.info(f"Subsystem ready: {name}")
+    except Exception as e:
+        READINESS[name] = "failed"
+        log.error(f"Subsystem warmup failed: {name} error={e}")
+
+
+@app.on_event("startup")
+async def warmup():
+    # schema must exist before any DB endpoint runs; this is fast
+    await warm_subsystem("db", init_database)
+
+    # heavy imports / model loads happen off the event loop; /menu etc. serve meanwhile
+    app.state.warmup_tasks = [
+        asyncio.create_task(warm_subsystem("recommender", init_recommender)),
+        asyncio.create_task(warm_subsystem("cv", verification_jobs.start)),
+    ]
+
+
+@app.on_event("startup")
+async def bind_event_loop():
+    # DB helpers publish from worker threads; events are delivered on this loop
+    ticket_events.bind_loop(asyncio.get_running_loop())
+
+
+async def purge_verifications_periodically():
+    while True:
+        try:
+            removed = await run_db(purge_old_verifications)
+            if removed:
+                log.info(f"Purged {removed} verification results older than {VERIFICATION_RETENTION_DAYS} days")
+        except Exception as e:
+            log.error(f"Verification purge failed error={e}")
+        await asyncio.sleep(VERIFICATION_PURGE_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_verification_purge():
+    app.state.verification_purge = asyncio.create_task(purge_verifications_periodically())
+
+
+async def snapshot_cooccurrence_periodically():
+    while True:
+        await asyncio.sleep(COOCCURRENCE_SNAPSHOT_INTERVAL)
+        try:
+            await asyncio.to_thread(cooccurrence.save_snapshot)
+        except Exception as e:
+            log.error(f"Co-occurrence snapshot failed error={e}")
+
+
+@app.on_event("startup")
+async def start_cooccurrence_snapshots():
+    app.state.cooccurrence_snapshots = asyncio.create_task(snapshot_cooccurrence_periodically())
+
+
+@app.on_event("startup")
+async def start_recommend_batcher():
+    recommend_batcher.start()
+
+
+async def refresh_materialized_periodically():
+    while True:
+        try:
+            if READINESS["recommender"] == "ready" and not materialized_recs.is_fresh():
+                await asyncio.to_thread(materialized_recs.refresh)
+        except Exception as e:
+            log.error(f"Materialized recommendations refresh failed error={e}")
+        await asyncio.sleep(MATERIALIZE_CHECK_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_materialized_refresh():
+    app.state.materialized_refresh = asyncio.create_task(refresh_materialized_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_recommend_batcher():
+    await recommend_batcher.stop()
+
+
+@app.on_event("shutdown")
+async def stop_verification_jobs():
+    await camera_streams.stop_all()
+    await verification_jobs.stop()
+
+
+@app.on_event("shutdown")
+def close_db_connections():
+    for name in ("verification_purge", "cooccurrence_snapshots", "materialized_refresh"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    if READINESS["recommender"] == "ready":
+        cooccurrence.save_snapshot()
+    close_all()
+
 # cors
 app.add_middleware(
     CORSMiddleware,
@@ -64,12 +192,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-MENU_FILE = os.path.join(os.path.dirname(__file__), "menu", "menu.json")
-
-
 def load_menu():
-    with open(MENU_FILE, "r") as f:
-        return json.load(f)
+    return get_menu_snapshot().data
 
 # ---------------------------
 # Pydantic models
@@ -79,12 +203,37 @@ class RecommendRequest(BaseModel):
     time: Optional[str] = None
     ticketId: Optional[int] = None
     profile: Optional[str] = "returning"
+    store: Optional[str] = None
+
+
+class RecommendBatchRequest(BaseModel):
+    requests: List[RecommendRequest]
+    top_k: Optional[int] = 3
+
+
+# latest epoch timestamp datetime can represent (9999-12-31T23:59:59.999Z), in ms
+MAX_ORDER_TIMESTAMP_MS = 253_402_300_799_999
 
 
 class OrderRequest(BaseModel):
     profile: str
     items: List[str]
-    timestamp: Optional[int] = None
+    # epoch seconds or milliseconds (see _created_at)
+    timestamp: Optional[int] = Field(None, ge=0, le=MAX_ORDER_TIMESTAMP_MS)
+    # phone / user id of a logged-in customer; feeds their order history
+    user: Optional[str] = None
+
+
+class OrderBatchRequest(BaseModel):
+    orders: List[OrderRequest]
+
+
+class AvailabilityRequest(BaseModel):
+    available: bool
+
+
+class InventoryUpdateRequest(BaseModel):
+    items: Dict[str, bool]
 
 
 class LoginRequest(BaseModel):
@@ -96,42 +245,200 @@ class RegisterRequest(BaseModel):
     name: Optional[str] = None
 
 
+class CameraStreamRequest(BaseModel):
+    # clip / frame directory under CAMERA_MEDIA_DIR, or an MJPEG / RTSP URL
+    # listed in CAMERA_ALLOWED_SOURCES
+    source: str
+    ticketId: Optional[int] = None
+    sample_fps: Optional[float] = None
+    # frame rate of a frame directory (video files / streams report their own)
+    fps: Optional[float] = None
+    # play recorded clips at their own pace (False: as fast as they decode)
+    realtime: bool = True
+    loop: bool = False
+
+
+class CameraTicketRequest(BaseModel):
+    ticketId: Optional[int] = None
+
+
 # ---------------------------
 # Helpers (tickets)
 # ---------------------------
-def insert_ticket(profile: str, items: List[str]) -> Dict[str, Any]:
-    conn = get_conn()
-    cur = conn.cursor()
+# statuses the kitchen still has to act on
+OPEN_STATUSES = ("created", "in_kitchen", "mismatch")
 
-    created_at = datetime.utcnow().isoformat()
+# max orders accepted by one /orders/batch call (committed as one transaction)
+MAX_BATCH_ORDERS = int(os.getenv("MAX_BATCH_ORDERS", "1000"))
+
+
+# seconds between co-occurrence snapshots (only written when it changed)
+COOCCURRENCE_SNAPSHOT_INTERVAL = float(os.getenv("COOCCURRENCE_SNAPSHOT_INTERVAL", "300"))
+
+
+def _created_at(timestamp: Optional[int] = None) -> str:
+    # POS clients send epoch seconds or milliseconds for offline-queued orders
+    if timestamp is None:
+        return datetime.utcnow().isoformat()
+    if timestamp > 10_000_000_000:
+        timestamp = timestamp / 1000
+    return datetime.utcfromtimestamp(timestamp).isoformat()
 
-    cur.execute(
-        "INSERT INTO tickets (created_at, profile, items, status) VALUES (?, ?, ?, ?)",
-        (created_at, profile, json.dumps(items), "created"),
-    )
 
-    ticket_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+def insert_ticket(
+    profile: str,
+    items: List[str],
+    status: str = "created",
+    timestamp: Optional[int] = None,
+    user_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    created_at = _created_at(timestamp)
+
+    with transaction() as cur:
+        cur.execute(
+            "INSERT INTO tickets (created_at, profile, items, status, user_id) VALUES (?, ?, ?, ?, ?)",
+            (created_at, profile, json.dumps(items), status, user_id),
+        )
+        ticket_id = cur.lastrowid
+        cur.executemany(
+            "INSERT INTO ticket_items (ticket_id, item_id, quantity) VALUES (?, ?, ?)",
+            ticket_item_rows(ticket_id, items),
+        )
+        log_status_change(cur, ticket_id, status, created_at)
+        if user_id:
+            record_user_items(cur, user_id, items, created_at)
+
+    invalidate_user_history(user_id)
+    cooccurrence.add_ticket(ticket_id, items)
+    ticket_events.publish(ticket_id, status, items=items)
 
     return {
         "id": ticket_id,
         "created_at": created_at,
         "profile": profile,
         "items": items,
-        "status": "created",
+        "status": status,
     }
 
 
+def insert_tickets(orders: List[OrderRequest], status: str = "created") -> List[Dict[str, Any]]:
+    """
+    Bulk insert with executemany in one BEGIN IMMEDIATE transaction: a
+    batch (at most MAX_BATCH_ORDERS) is stored whole or not at all, so a
+    POS retrying a failed resync can't create duplicate tickets. Holding
+    the write lock also keeps the AUTOINCREMENT ids contiguous, so they
+    can be derived from last_insert_rowid().
+    """
+    rows = [
+        (_created_at(o.timestamp), o.profile, json.dumps(o.items), status, o.user)
+        for o in orders
+    ]
+
+    with transaction(immediate=True) as cur:
+        cur.executemany(
+            "INSERT INTO tickets (created_at, profile, items, status, user_id) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+        first_id = last_id - len(rows) + 1
+        item_rows = []
+        for offset, o in enumerate(orders):
+            item_rows.extend(ticket_item_rows(first_id + offset, o.items))
+        cur.executemany(
+            "INSERT INTO ticket_items (ticket_id, item_id, quantity) VALUES (?, ?, ?)",
+            item_rows,
+        )
+        cur.executemany(
+            "INSERT INTO ticket_status_log (ticket_id, status, changed_at) VALUES (?, ?, ?)",
+            [(first_id + offset, status, row[0]) for offset, row in enumerate(rows)],
+        )
+        for o, row in zip(orders, rows):
+            if o.user:
+                record_user_items(cur, o.user, o.items, row[0])
+
+    for o in orders:
+        invalidate_user_history(o.user)
+
+    cooccurrence.add_tickets((first_id + offset, o.items) for offset, o in enumerate(orders))
+
+    tickets = []
+    for offset, (o, row) in enumerate(zip(orders, rows)):
+        tickets.append({
+            "id": first_id + offset,
+            "created_at": row[0],
+            "profile": o.profile,
+            "items": o.items,
+            "status": status,
+        })
+        ticket_events.publish(first_id + offset, status, items=o.items)
+
+    return tickets
+
+
+def load_cooccurrence():
+    """Co-occurrence model: last snapshot plus the tickets inserted since."""
+    try:
+        conn = get_conn()
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tickets").fetchone()[0]
+        since = cooccurrence.load_snapshot(max_ticket_id=max_id)
+        rows = conn.execute(
+            "SELECT ticket_id, item_id FROM ticket_items WHERE ticket_id > ? ORDER BY ticket_id",
+            (since,),
+        )
+        cooccurrence.replay(rows)
+    finally:
+        # never leave live inserts parked, even if the load failed
+        cooccurrence.finish_loading()
+    log.info(f"Co-occurrence model loaded {cooccurrence.stats()}")
+
+
 def get_ticket(ticket_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
+    row = get_conn().execute(
         "SELECT id, created_at, profile, items, status FROM tickets WHERE id = ?",
         (ticket_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
+    ).fetchone()
+
+    if not row:
+        return None
+
+    return {
+        "id": row[0],
+        "created_at": row[1],
+        "profile": row[2],
+        "items": json.loads(row[3]),
+        "status": row[4],
+    }
+
+
+def set_ticket_status(ticket_id: int, status: str, verification: Optional[Dict[str, Any]] = None):
+    """Updates status (and optionally stores the CV verification) in one transaction."""
+    now = datetime.utcnow().isoformat()
+
+    with transaction() as cur:
+        cur.execute("UPDATE tickets SET status = ? WHERE id = ?", (status, ticket_id))
+        updated = cur.rowcount
+        if updated:
+            log_status_change(cur, ticket_id, status, now)
+            if verification is not None:
+                cur.execute(
+                    "INSERT OR REPLACE INTO ticket_verifications (ticket_id, result, verified_at) VALUES (?, ?, ?)",
+                    (ticket_id, json.dumps(verification), now),
+                )
+
+    if updated:
+        ticket_events.publish(ticket_id, status)
+
+def get_ticket_with_verification(ticket_id: int) -> Optional[Dict[str, Any]]:
+    row = get_conn().execute(
+        """
+        SELECT t.id, t.created_at, t.profile, t.items, t.status, v.result
+        FROM tickets t
+        LEFT JOIN ticket_verifications v ON v.ticket_id = t.id
+        WHERE t.id = ?
+        """,
+        (ticket_id,),
+    ).fetchone()
 
     if not row:
         return None
@@ -142,22 +449,170 @@ def get_ticket(ticket_id: int) -> Optional[Dict[str, Any]]:
         "profile": row[2],
         "items": json.loads(row[3]),
         "status": row[4],
+        "verification": json.loads(row[5]) if row[5] else {"status": "pending", "missing": []},
     }
 
 
-def set_ticket_status(ticket_id: int, status: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE tickets SET status = ? WHERE id = ?", (status, ticket_id))
-    conn.commit()
-    conn.close()
+# how long verification results are kept, and how often old ones are purged
+VERIFICATION_RETENTION_DAYS = float(os.getenv("VERIFICATION_RETENTION_DAYS", "7"))
+VERIFICATION_PURGE_INTERVAL = float(os.getenv("VERIFICATION_PURGE_INTERVAL", "3600"))
+
+
+def purge_old_verifications(retention_days: float = VERIFICATION_RETENTION_DAYS) -> int:
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+    with transaction() as cur:
+        cur.execute("DELETE FROM ticket_verifications WHERE verified_at < ?", (cutoff,))
+        return cur.rowcount
+
+
+def find_open_tickets_with_item(item_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """Open tickets containing item_id, oldest first (ticket_items + status index)."""
+    placeholders = ",".join("?" for _ in OPEN_STATUSES)
+    rows = get_conn().execute(
+        f"""
+        SELECT t.id, t.created_at, t.status, ti.quantity
+        FROM ticket_items ti
+        JOIN tickets t ON t.id = ti.ticket_id
+        WHERE ti.item_id = ? AND t.status IN ({placeholders})
+        ORDER BY t.created_at, t.id
+        LIMIT ?
+        """,
+        (item_id, *OPEN_STATUSES, limit),
+    ).fetchall()
+
+    return [
+        {"id": r[0], "created_at": r[1], "status": r[2], "quantity": r[3]}
+        for r in rows
+    ]
+
+
+# ---------------------------
+# Helpers (KDS board)
+# ---------------------------
+# kitchen stations and the menu tags routed to them
+STATION_TAGS = {
+    "grill": {"main"},
+    "fryer": {"side"},
+    "drinks": {"drink"},
+    "dessert": {"dessert"},
+}
+MAX_BOARD_TICKETS = int(os.getenv("MAX_BOARD_TICKETS", "500"))
+
+
+def station_item_ids(station: str) -> set:
+    tags = STATION_TAGS[station]
+    return {it["id"] for it in load_menu() if tags.intersection(it.get("tags", []))}
+
+
+def _board_rows(rows, station: Optional[str]) -> List[Dict[str, Any]]:
+    wanted = station_item_ids(station) if station else None
+    tickets = []
+    for r in rows:
+        items = json.loads(r[3])
+        if wanted is not None:
+            items = [i for i in items if i in wanted]
+            if not items:
+                continue
+        tickets.append({
+            "id": r[0],
+            "created_at": r[1],
+            "status": r[2],
+            "items": items,
+            "open": r[2] in OPEN_STATUSES,
+        })
+    return tickets
+
+
+def current_board_cursor() -> int:
+    row = get_conn().execute("SELECT MAX(seq) FROM ticket_status_log").fetchone()
+    return row[0] or 0
+
+
+def get_kds_board(station: Optional[str] = None) -> Dict[str, Any]:
+    """
+    All open tickets (for a station: those with at least one of its items),
+    oldest first, plus the cursor to pass as ?since= next time. At most
+    MAX_BOARD_TICKETS are returned; "truncated" says whether more exist.
+    """
+    # read the cursor first: anything changing meanwhile shows up in the next delta
+    cursor = current_board_cursor()
+    placeholders = ",".join("?" for _ in OPEN_STATUSES)
+    params: List[Any] = list(OPEN_STATUSES)
+    station_filter = ""
+    if station:
+        # filter before the LIMIT, through the ticket_items (item_id, ticket_id) index
+        wanted = sorted(station_item_ids(station))
+        if not wanted:
+            return {"cursor": cursor, "full": True, "truncated": False, "tickets": []}
+        station_filter = (
+            "AND EXISTS (SELECT 1 FROM ticket_items ti WHERE ti.ticket_id = t.id "
+            f"AND ti.item_id IN ({','.join('?' for _ in wanted)}))"
+        )
+        params.extend(wanted)
+    rows = get_conn().execute(
+        f"""
+        SELECT id, created_at, status, items FROM tickets t
+        WHERE status IN ({placeholders}) {station_filter}
+        ORDER BY created_at, id
+        LIMIT ?
+        """,
+        (*params, MAX_BOARD_TICKETS + 1),
+    ).fetchall()
+
+    truncated = len(rows) > MAX_BOARD_TICKETS
+    return {
+        "cursor": cursor,
+        "full": True,
+        "truncated": truncated,
+        "tickets": _board_rows(rows[:MAX_BOARD_TICKETS], station),
+    }
+
+
+def get_kds_board_delta(since: int, station: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Tickets whose status changed after `since`, read from ticket_status_log,
+    so the cost is O(changes). Closed tickets come back with open=False so
+    screens can drop them.
+    """
+    cursor = current_board_cursor()
+    if since > cursor:
+        # cursor from another database (reset / restore): resync fully
+        return get_kds_board(station)
+
+    changed = get_conn().execute(
+        "SELECT DISTINCT ticket_id FROM ticket_status_log WHERE seq > ? AND seq <= ? LIMIT ?",
+        (since, cursor, MAX_BOARD_TICKETS + 1),
+    ).fetchall()
+    if len(changed) > MAX_BOARD_TICKETS:
+        return get_kds_board(station)
+    if not changed:
+        return {"cursor": cursor, "full": False, "truncated": False, "tickets": []}
+
+    ids = [r[0] for r in changed]
+    placeholders = ",".join("?" for _ in ids)
+    rows = get_conn().execute(
+        f"SELECT id, created_at, status, items FROM tickets WHERE id IN ({placeholders}) ORDER BY created_at, id",
+        ids,
+    ).fetchall()
+
+    return {"cursor": cursor, "full": False, "truncated": False, "tickets": _board_rows(rows, station)}
+
+
+def get_ticket_items_many(ticket_ids: List[int]) -> Dict[int, List[str]]:
+    """{ticket_id: items} for many tickets in one query."""
+    if not ticket_ids:
+        return {}
+    placeholders = ",".join("?" for _ in ticket_ids)
+    rows = get_conn().execute(
+        f"SELECT id, items FROM tickets WHERE id IN ({placeholders})", ticket_ids
+    ).fetchall()
+    return {r[0]: json.loads(r[1]) for r in rows}
+
 
 def get_ticket_details(ticket_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("SELECT id, items, status FROM tickets WHERE id = ?", (ticket_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = get_conn().execute(
+        "SELECT id, items, status FROM tickets WHERE id = ?", (ticket_id,)
+    ).fetchone()
 
     if not row:
         return {"ticket": None}
@@ -169,15 +624,56 @@ def get_ticket_details(ticket_id: int):
             "status": row[2]
         }
     }
+
+
+# ---------------------------
+# Helpers (users)
+# ---------------------------
+def find_user_by_phone(phone: str) -> Optional[Dict[str, Any]]:
+    row = get_conn().execute(
+        "SELECT id, phone, name, profile FROM users WHERE phone = ?", (phone,)
+    ).fetchone()
+
+    if not row:
+        return None
+
+    return {"id": row[0], "phone": row[1], "name": row[2], "profile": row[3]}
+
+
+def create_user(phone: str, name: Optional[str], profile: str):
+    # raises sqlite3.IntegrityError if the phone is already registered
+    with transaction() as cur:
+        cur.execute(
+            "INSERT INTO users (phone, name, profile) VALUES (?, ?, ?)",
+            (phone, name, profile),
+        )
+
+
 # ---------------------------
 # Endpoints
 # ---------------------------
 
 @app.get("/menu")
 async def get_menu(request: Request):
-    menu = load_menu()
+    snap = get_menu_snapshot()
+    headers = {"ETag": snap.etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), snap.etag):
+        log.info("Menu not modified", extra={"correlation_id": request.state.correlation_id})
+        return Response(status_code=304, headers=headers)
+
     log.info("Menu returned", extra={"correlation_id": request.state.correlation_id})
-    return menu
+    return Response(content=snap.body, media_type="application/json", headers=headers)
+
+
+@app.get("/ready")
+async def ready():
+    ok = all(state == "ready" for state in READINESS.values())
+    return Response(
+        content=json.dumps({"ready": ok, "subsystems": READINESS}),
+        media_type="application/json",
+        status_code=200 if ok else 503,
+    )
 
 
 # ---------------------------
@@ -190,14 +686,9 @@ async def auth_login(req: LoginRequest, request: Request):
     log.info(f"Login attempt for phone={phone}",
              extra={"correlation_id": request.state.correlation_id})
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, phone, name, profile FROM users WHERE phone = ?", (phone,))
-    row = cur.fetchone()
-    conn.close()
+    user = await run_db(find_user_by_phone, phone)
 
-    if row:
-        user = {"id": row[0], "phone": row[1], "name": row[2], "profile": row[3]}
+    if user:
         log.info(f"Login success for phone={phone}",
                  extra={"correlation_id": request.state.correlation_id})
         return {"exists": True, "user": user}
@@ -218,15 +709,8 @@ async def auth_register(req: RegisterRequest, request: Request):
         extra={"correlation_id": request.state.correlation_id},
     )
 
-    conn = get_conn()
-    cur = conn.cursor()
     try:
-        cur.execute(
-            "INSERT INTO users (phone, name, profile) VALUES (?, ?, ?)",
-            (phone, name, profile),
-        )
-        conn.commit()
-        conn.close()
+        await run_db(create_user, phone, name, profile)
         log.info(
             f"Registered user phone={phone}",
             extra={"correlation_id": request.state.correlation_id},
@@ -234,7 +718,6 @@ async def auth_register(req: RegisterRequest, request: Request):
         return {"status": "created", "phone": phone, "profile": "in_store"}
 
     except sqlite3.IntegrityError:
-        conn.close()
         log.warning(
             f"Register attempt for existing phone={phone}",
             extra={"correlation_id": request.state.correlation_id},
@@ -242,7 +725,6 @@ async def auth_register(req: RegisterRequest, request: Request):
         return {"status": "exists", "phone": phone}
 
     except Exception as e:
-        conn.close()
         log.error(
             f"Register failed phone={phone} error={e}",
             extra={"correlation_id": request.state.correlation_id},
@@ -254,6 +736,49 @@ async def auth_register(req: RegisterRequest, request: Request):
 # Recommendation
 # ---------------------------
 
+# DEMO HARDCODED PROFILE LOGIC
+DEMO_RECS = {
+    "profile_veg": [
+        {"id": "salad", "name": "Fresh Garden Salad", "reason": "Veg-friendly choice"},
+        {"id": "veggie_burger", "name": "Veggie Burger", "reason": "Popular veg item"},
+        {"id": "smoothie", "name": "Green Smoothie", "reason": "Healthy vegetarian drink"}
+    ],
+    "profile_fitness": [
+        {"id": "protein_bowl", "name": "High-Protein Bowl", "reason": "Fitness-focused energy"},
+        {"id": "grilled_chicken", "name": "Grilled Chicken", "reason": "Lean protein"},
+        {"id": "energy_smoothie", "name": "Energy Smoothie", "reason": "Workout booster"}
+    ],
+    "profile_kids": [
+        {"id": "kids_meal", "name": "Kids Meal Combo", "reason": "Child-friendly portion"},
+        {"id": "ice_cream", "name": "Chocolate Ice Cream", "reason": "Kids favorite"},
+        {"id": "fries", "name": "Fries", "reason": "Popular with kids"}
+    ],
+}
+
+# max carts scored by one /recommend/batch call
+MAX_RECOMMEND_BATCH = int(os.getenv("MAX_RECOMMEND_BATCH", "256"))
+
+# micro-batching for /recommend (RECOMMEND_BATCH_MAX_SIZE / _MAX_WAIT_MS;
+# a max size of 1 turns batching off but keeps inference off the event loop)
+recommend_batcher = MicroBatcher(
+    # histories for the whole micro-batch in one lookup, on the batcher thread
+    lambda reqs: get_recommendations_vector_batch(with_user_histories(reqs), top_k=3),
+    name="recommend",
+)
+
+# context-free requests (no ticket, anonymous) are answered from a precomputed table
+materialized_recs = MaterializedRecs(
+    MATERIALIZED_PROFILES, [STORE_ID],
+    extra_version=lambda: get_menu_snapshot().etag,
+)
+# seconds between freshness checks of the table (it is rebuilt only on change)
+MATERIALIZE_CHECK_INTERVAL = float(os.getenv("MATERIALIZE_CHECK_INTERVAL", "1.0"))
+
+
+def is_context_free(req: RecommendRequest) -> bool:
+    return not req.ticketId and req.user in (None, "anonymous")
+
+
 @app.post("/recommend")
 async def recommend(req: RecommendRequest, request: Request):
     log.info(
@@ -261,51 +786,35 @@ async def recommend(req: RecommendRequest, request: Request):
         extra={"correlation_id": request.state.correlation_id},
     )
 
-    # -----------------------------------------
-    # DEMO HARDCODED PROFILE LOGIC
-    # -----------------------------------------
-    demo_recs = {
-        "profile_veg": [
-            {"id": "salad", "name": "Fresh Garden Salad", "reason": "Veg-friendly choice"},
-            {"id": "veggie_burger", "name": "Veggie Burger", "reason": "Popular veg item"},
-            {"id": "smoothie", "name": "Green Smoothie", "reason": "Healthy vegetarian drink"}
-        ],
-        "profile_fitness": [
-            {"id": "protein_bowl", "name": "High-Protein Bowl", "reason": "Fitness-focused energy"},
-            {"id": "grilled_chicken", "name": "Grilled Chicken", "reason": "Lean protein"},
-            {"id": "energy_smoothie", "name": "Energy Smoothie", "reason": "Workout booster"}
-        ],
-        "profile_kids": [
-            {"id": "kids_meal", "name": "Kids Meal Combo", "reason": "Child-friendly portion"},
-            {"id": "ice_cream", "name": "Chocolate Ice Cream", "reason": "Kids favorite"},
-            {"id": "fries", "name": "Fries", "reason": "Popular with kids"}
-        ],
-    }
-
     # if profile matches demo profiles → return hardcoded recs
-    if req.profile in demo_recs:
+    if req.profile in DEMO_RECS:
         log.info(
             f"Demo profile detected. Returning preset recs.",
             extra={"correlation_id": request.state.correlation_id},
         )
-        return {"recommendations": demo_recs[req.profile]}
+        return {"recommendations": inventory.filter_ids(DEMO_RECS[req.profile])}
+
+    if is_context_free(req):
+        recs = materialized_recs.get(req.store, req.profile, req.time)
+        if recs is not None:
+            return {"recommendations": recs}
 
     # -----------------------------------------
     # FALLBACK TO ORIGINAL ML RECOMMENDER
     # -----------------------------------------
     context_items = []
     if req.ticketId:
-        ticket = get_ticket(req.ticketId)
+        ticket = await run_db(get_ticket, req.ticketId)
         if ticket:
             context_items = ticket["items"]
 
-    recs = get_recommendations_vector(
-        user=req.user,
-        profile=req.profile,
-        timestamp=req.time,
-        context_ticket_items=context_items,
-        top_k=3
-    )
+    # concurrent /recommend calls are encoded + searched together off the event loop
+    recs = await recommend_batcher.submit({
+        "user": req.user,
+        "profile": req.profile,
+        "timestamp": req.time,
+        "context_ticket_items": context_items,
+    })
 
     log.info(
         f"Recommendation result={recs}",
@@ -315,6 +824,115 @@ async def recommend(req: RecommendRequest, request: Request):
     return {"recommendations": recs}
 
 
+@app.post("/recommend/batch")
+async def recommend_batch(req: RecommendBatchRequest, request: Request):
+    """
+    Recommendations for many carts at once (kiosk prefetch). Demo profiles
+    are answered from DEMO_RECS; everything else goes through a single
+    batched vector search.
+    """
+    log.info(
+        f"Recommend batch called size={len(req.requests)}",
+        extra={"correlation_id": request.state.correlation_id},
+    )
+
+    if len(req.requests) > MAX_RECOMMEND_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many requests in one batch (max {MAX_RECOMMEND_BATCH})",
+        )
+
+    top_k = max(1, min(req.top_k or 3, 10))
+
+    ticket_ids = list({r.ticketId for r in req.requests if r.ticketId and r.profile not in DEMO_RECS})
+    ticket_items = await run_db(get_ticket_items_many, ticket_ids)
+
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * len(req.requests)
+    pending_idx = []
+    pending = []
+    for i, r in enumerate(req.requests):
+        if r.profile in DEMO_RECS:
+            results[i] = inventory.filter_ids(DEMO_RECS[r.profile])
+            continue
+        if top_k == materialized_recs.top_k and is_context_free(r):
+            results[i] = materialized_recs.get(r.store, r.profile, r.time)
+            if results[i] is not None:
+                continue
+        pending_idx.append(i)
+        pending.append({
+            "user": r.user,
+            "profile": r.profile,
+            "timestamp": r.time,
+            "context_ticket_items": ticket_items.get(r.ticketId, []),
+        })
+
+    if pending:
+        pending = await run_db(with_user_histories, pending)
+        # encode + search + rerank of up to MAX_RECOMMEND_BATCH carts: off the event loop
+        recs = await asyncio.to_thread(get_recommendations_vector_batch, pending, top_k=top_k)
+        for i, rec in zip(pending_idx, recs):
+            results[i] = rec
+
+    return {"results": [{"recommendations": r} for r in results]}
+
+
+@app.get("/recommend/stats")
+async def recommend_stats():
+    return {
+        "cache": cache_stats(),
+        "cooccurrence": cooccurrence.stats(),
+        "user_history": user_history_cache_stats(),
+        "batcher": recommend_batcher.stats(),
+        "materialized": materialized_recs.stats(),
+    }
+
+
+@app.get("/users/{user_id}/history")
+async def user_history(user_id: str):
+    return {"user": user_id, "items": await run_db(load_user_item_stats, user_id)}
+
+
+# ---------------------------
+# Inventory (86 list)
+# ---------------------------
+
+def inventory_item_ids() -> set:
+    """Ids the 86 list accepts: the ordering menu plus the recommender's catalogue."""
+    return {it["id"] for it in load_menu()} | {it["id"] for it in load_recommender_menu()}
+
+
+@app.get("/inventory")
+async def get_inventory():
+    return {"version": inventory.version, "items": inventory.snapshot()}
+
+
+@app.put("/inventory/{item_id}")
+async def set_item_availability(item_id: str, req: AvailabilityRequest, request: Request):
+    """86 an item (available=false) or bring it back; recommendations skip it immediately."""
+    if item_id not in inventory_item_ids():
+        raise HTTPException(status_code=404, detail=f"Unknown menu item {item_id}")
+    version = inventory.set_available(item_id, req.available)
+    log.info(
+        f"Inventory update item={item_id} available={req.available}",
+        extra={"correlation_id": request.state.correlation_id, "inventory_version": version},
+    )
+    return {"id": item_id, "available": req.available, "version": version}
+
+
+@app.post("/inventory")
+async def update_inventory(req: InventoryUpdateRequest, request: Request):
+    # all or nothing: a typo must not half-apply a bulk 86
+    unknown = sorted(set(req.items) - inventory_item_ids())
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown menu items: {', '.join(unknown)}")
+    version = inventory.set_many(req.items)
+    log.info(
+        f"Inventory bulk update count={len(req.items)}",
+        extra={"correlation_id": request.state.correlation_id, "inventory_version": version},
+    )
+    return {"version": version, "items": inventory.snapshot()}
+
+
 # ---------------------------
 # Order, KDS, Verify
 # ---------------------------
@@ -329,8 +947,7 @@ async def create_order(req: OrderRequest, request: Request):
     if not req.items:
         raise HTTPException(status_code=400, detail="No items provided")
 
-    ticket = insert_ticket(req.profile, req.items)
-    set_ticket_status(ticket["id"], "in_kitchen")
+    ticket = await run_db(insert_ticket, req.profile, req.items, "in_kitchen", req.timestamp, req.user)
 
     log.info(
         f"Order created ticket_id={ticket['id']}",
@@ -340,6 +957,122 @@ async def create_order(req: OrderRequest, request: Request):
     return {"id": ticket["id"], "status": "in_kitchen", "items": ticket["items"]}
 
 
+@app.post("/orders/batch")
+async def create_orders_batch(req: OrderBatchRequest, request: Request):
+    log.info(
+        f"Batch order ingest count={len(req.orders)}",
+        extra={"correlation_id": request.state.correlation_id},
+    )
+
+    if not req.orders:
+        raise HTTPException(status_code=400, detail="No orders provided")
+
+    if len(req.orders) > MAX_BATCH_ORDERS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many orders in one batch (max {MAX_BATCH_ORDERS})",
+        )
+
+    empty = [i for i, o in enumerate(req.orders) if not o.items]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"No items provided for orders at index {empty}")
+
+    tickets = await run_db(insert_tickets, req.orders, "in_kitchen")
+
+    log.info(
+        f"Batch orders created first_id={tickets[0]['id']} last_id={tickets[-1]['id']}",
+        extra={"correlation_id": request.state.correlation_id},
+    )
+
+    return {
+        "count": len(tickets),
+        "orders": [
+            {"id": t["id"], "status": t["status"], "items": t["items"]}
+            for t in tickets
+        ],
+    }
+
+
+@app.get("/kds/items/{item_id}")
+async def kds_open_tickets_with_item(item_id: str, request: Request, limit: int = Query(100, ge=1, le=1000)):
+    log.info(
+        f"KDS open tickets with item={item_id}",
+        extra={"correlation_id": request.state.correlation_id},
+    )
+
+    tickets = await run_db(find_open_tickets_with_item, item_id, limit)
+    return {"item": item_id, "count": len(tickets), "tickets": tickets}
+
+
+@app.get("/kds/board")
+async def kds_board(
+    request: Request,
+    station: Optional[str] = Query(None),
+    since: Optional[int] = Query(None, ge=0),
+):
+    if station is not None and station not in STATION_TAGS:
+        raise HTTPException(status_code=404, detail=f"Unknown station {station}")
+
+    if since is None:
+        board = await run_db(get_kds_board, station)
+    else:
+        board = await run_db(get_kds_board_delta, since, station)
+
+    log.info(
+        f"KDS board station={station} since={since} cursor={board['cursor']} count={len(board['tickets'])}",
+        extra={"correlation_id": request.state.correlation_id},
+    )
+    return board
+
+
+# seconds between SSE keep-alive comments (proxies drop idle streams)
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+
+@app.get("/kds/stream")
+async def kds_stream(request: Request, ticket_id: Optional[int] = Query(None)):
+    """
+    Server-Sent Events feed of ticket status changes.
+    Without ticket_id: every ticket (kitchen screens).
+    With ticket_id: current status first, then changes of that ticket (customer display).
+    """
+    log.info(
+        f"KDS stream opened ticket_id={ticket_id}",
+        extra={"correlation_id": request.state.correlation_id},
+    )
+
+    sub = ticket_events.subscribe(ticket_id)
+
+    initial = None
+    if ticket_id is not None:
+        ticket = await run_db(get_ticket, ticket_id)
+        if not ticket:
+            ticket_events.unsubscribe(sub)
+            raise HTTPException(status_code=404, detail="Ticket not found")
+        initial = {"ticketId": ticket_id, "status": ticket["status"], "items": ticket["items"]}
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            if initial:
+                yield sse_format(initial)
+            while not await request.is_disconnected():
+                event = await sub.get(SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_format(event)
+        finally:
+            ticket_events.unsubscribe(sub)
+            log.info(f"KDS stream closed ticket_id={ticket_id}")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/kds/{ticket_id}")
 async def kds_status(ticket_id: int, request: Request):
     log.info(
@@ -347,18 +1080,11 @@ async def kds_status(ticket_id: int, request: Request):
         extra={"correlation_id": request.state.correlation_id},
     )
 
-    ticket = get_ticket(ticket_id)
+    ticket = await run_db(get_ticket_with_verification, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    vfile = f"verification_{ticket_id}.json"
-    verification = None
-
-    if os.path.exists(vfile):
-        with open(vfile, "r") as f:
-            verification = json.load(f)
-    else:
-        verification = {"status": "pending", "missing": []}
+    verification = ticket.pop("verification")
 
     log.info(
         f"KDS returning ticket={ticket} verification={verification}",
@@ -368,18 +1094,99 @@ async def kds_status(ticket_id: int, request: Request):
     return {"ticketId": ticket_id, "status": ticket["status"], "verification": verification}
 
 
+# multipart boundaries + part headers on top of the image itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+VERIFY_SAMPLE_IMAGE = "cv/sample.jpg"
+
+
+async def read_verify_upload(request: Request) -> Optional[bytes | bytearray]:
+    """
+    Image bytes sent to /verify, either as a multipart form field (`image`
+    or `file`) or as the raw request body (image/jpeg, image/png,
+    application/octet-stream). None when nothing was uploaded. Oversized
+    uploads are refused from Content-Length or once the stream passes the
+    limit, never buffered in full. The form parser spools whatever it is
+    sent, so multipart uploads must declare a Content-Length (411 otherwise).
+    """
+    content_type = request.headers.get("content-type", "")
+    declared = request.headers.get("content-length")
+    declared = int(declared) if declared and declared.isdigit() else None
+
+    if content_type.startswith("multipart/form-data"):
+        if declared is None:
+            raise HTTPException(411, "Content-Length required for multipart uploads")
+        if declared > VERIFY_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+            raise HTTPException(413, f"Image larger than {VERIFY_MAX_UPLOAD_BYTES} bytes")
+        form = await request.form(max_files=1, max_fields=4)
+        upload = form.get("image") or form.get("file")
+        if upload is None or isinstance(upload, str):
+            return None
+        if upload.size is not None and upload.size > VERIFY_MAX_UPLOAD_BYTES:
+            raise HTTPException(413, f"Image larger than {VERIFY_MAX_UPLOAD_BYTES} bytes")
+        return await upload.read()
+
+    if declared is not None and declared > VERIFY_MAX_UPLOAD_BYTES:
+        raise HTTPException(413, f"Image larger than {VERIFY_MAX_UPLOAD_BYTES} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > VERIFY_MAX_UPLOAD_BYTES:
+            raise HTTPException(413, f"Image larger than {VERIFY_MAX_UPLOAD_BYTES} bytes")
+    return body or None
+
+
+def verification_result(expected: List[str], detected: List[str]) -> tuple:
+    """(ticket status, verification result) for the items seen on the tray."""
+    missing = [i for i in expected if i not in detected]
+    extra_items = [d for d in detected if d not in expected]
+
+    if not missing and not extra_items:
+        return "verified", {
+            "status": "ok",
+            "verified": True,
+            "expected": expected,
+            "detected": detected,
+        }
+    return "mismatch", {
+        "status": "mismatch",
+        "verified": False,
+        "expected": expected,
+        "detected": detected,
+        "missing": missing,
+        "extra": extra_items,
+    }
+
+
+# detection runs on worker processes; see cv/jobs.py
+verification_jobs = VerificationJobs()
+# longest a single request may hold a connection waiting for a job
+VERIFY_MAX_WAIT_SECONDS = float(os.getenv("VERIFY_MAX_WAIT_SECONDS", "30"))
+
+
 @app.post("/verify")
 async def verify(
     request: Request,
+    response: Response,
     ticket_id: int = Query(...),
     sample_hint: Optional[str] = Query(None),
+    wait: float = Query(0, ge=0),
 ):
+    """
+    Queues a check of a tray photo against the ticket and returns the job
+    (202). The photo is uploaded as multipart (`image` field) or as the raw
+    JPEG/PNG body; without an upload the bundled sample image is used
+    (demo, with sample_hint driving the mock detector). The ticket status
+    is updated when the job finishes. With wait=N the call blocks up to N
+    seconds and returns the finished job (200) if it is ready by then.
+    """
     log.info(
         f"Verify called ticket_id={ticket_id} hint={sample_hint}",
         extra={"correlation_id": request.state.correlation_id},
     )
 
-    ticket = get_ticket(ticket_id)
+    data = await read_verify_upload(request)
+
+    ticket = await run_db(get_ticket, ticket_id)
     if not ticket:
         log.warning(
             "Ticket not found",
@@ -387,36 +1194,149 @@ async def verify(
         )
         return {"status": "error", "msg": "ticket not found"}
 
-    img_path = "cv/sample.jpg"
-    detected = detect_items(img_path, sample_hint)
+    if data is None:
+        image = VERIFY_SAMPLE_IMAGE
+    else:
+        try:
+            # header-only checks here; decode happens in the worker
+            check_image(data)
+        except ImageRejected as e:
+            log.warning(
+                "Verify image rejected",
+                extra={"correlation_id": request.state.correlation_id, "ticket_id": ticket_id, "error": e.detail},
+            )
+            raise HTTPException(e.status_code, e.detail)
+        image = data
+
     expected = ticket["items"]
 
-    missing = [i for i in expected if i not in detected]
-    extra_items = [d for d in detected if d not in expected]
+    async def finalize(detected: List[str]) -> Dict[str, Any]:
+        status, result = verification_result(expected, detected)
+        await run_db(set_ticket_status, ticket_id, status, result)
+        return result
+
+    try:
+        job = verification_jobs.submit(ticket_id, image, sample_hint, finalize)
+    except JobQueueFull as e:
+        log.warning(
+            "Verification queue full",
+            extra={"correlation_id": request.state.correlation_id, "ticket_id": ticket_id, "error": str(e)},
+        )
+        raise HTTPException(503, "Verification queue is full, retry shortly", headers={"Retry-After": "1"})
+
+    if wait > 0:
+        job = await verification_jobs.wait(job["jobId"], min(wait, VERIFY_MAX_WAIT_SECONDS))
+    response.status_code = 202 if job["finished_at"] is None else 200
+    return job
+
+
+@app.get("/verify/jobs/{job_id}")
+async def verify_job(job_id: str, response: Response, wait: float = Query(0, ge=0)):
+    """Job state (queued | running | done | failed) and result; wait=N long-polls up to N seconds."""
+    job = await verification_jobs.wait(job_id, min(wait, VERIFY_MAX_WAIT_SECONDS))
+    if job is None:
+        raise HTTPException(404, "Unknown or expired verification job")
+    response.status_code = 202 if job["finished_at"] is None else 200
+    return job
+
+
+@app.get("/cv/stats")
+async def cv_stats():
+    """Verification job queue, plus backends, instances and per-stage timings of one worker."""
+    return {"jobs": verification_jobs.stats(), "worker": await verification_jobs.worker_stats()}
+
+
+# ---------------------------
+# Camera feed: continuous verification (see cv/camera.py)
+# ---------------------------
+camera_streams = CameraStreams()
+
+
+async def verify_camera_frame(ticket_id: int, frame) -> Optional[Dict[str, Any]]:
+    """
+    Detection for one changed camera frame, through the verification job
+    queue. The ticket status is only written when the outcome changes, so
+    a tray sitting under the camera does not churn statuses / KDS events.
+    """
+    ticket = await run_db(get_ticket, ticket_id)
+    if not ticket:
+        return None
+
+    async def finalize(detected: List[str]) -> Dict[str, Any]:
+        status, result = verification_result(ticket["items"], detected)
+        if status != ticket["status"]:
+            await run_db(set_ticket_status, ticket_id, status, result)
+            ticket["status"] = status
+        return result
+
+    job = verification_jobs.submit(ticket_id, frame, None, finalize)
+    job = await verification_jobs.wait(job["jobId"], VERIFY_MAX_WAIT_SECONDS)
+    if job["finished_at"] is None:
+        # still queued / running: fail the frame so the stream re-checks the change
+        raise TimeoutError(f"Verification job {job['jobId']} not done after {VERIFY_MAX_WAIT_SECONDS}s")
+    if job["state"] == "failed":
+        raise RuntimeError(job["error"])
+    return job["result"]
+
+
+@app.post("/camera/streams")
+async def start_camera_stream(req: CameraStreamRequest, request: Request):
+    try:
+        stream = await camera_streams.start(
+            req.source,
+            verify_camera_frame,
+            fps=req.fps,
+            ticket_id=req.ticketId,
+            sample_fps=req.sample_fps if req.sample_fps is not None else CAMERA_SAMPLE_FPS,
+            realtime=req.realtime,
+            loop=req.loop,
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    log.info(
+        f"Camera stream {stream.id} started source={req.source} ticket_id={req.ticketId}",
+        extra={"correlation_id": request.state.correlation_id},
+    )
+    return stream.stats()
+
+
+@app.get("/camera/streams")
+async def list_camera_streams():
+    return {"streams": camera_streams.stats()}
+
+
+@app.get("/camera/streams/{stream_id}")
+async def get_camera_stream(stream_id: str):
+    stream = camera_streams.get(stream_id)
+    if stream is None:
+        raise HTTPException(404, "Unknown camera stream")
+    return stream.stats()
+
+
+@app.put("/camera/streams/{stream_id}/ticket")
+async def set_camera_stream_ticket(stream_id: str, req: CameraTicketRequest):
+    """Binds the ticket whose tray is now under the camera (None: pass is empty)."""
+    stream = camera_streams.get(stream_id)
+    if stream is None:
+        raise HTTPException(404, "Unknown camera stream")
+    stream.set_ticket(req.ticketId)
+    return stream.stats()
+
+
+@app.delete("/camera/streams/{stream_id}")
+async def stop_camera_stream(stream_id: str):
+    stream = await camera_streams.stop(stream_id)
+    if stream is None:
+        raise HTTPException(404, "Unknown camera stream")
+    return stream.stats()
 
-    if not missing and not extra_items:
-        set_ticket_status(ticket_id, "verified")
-        result = {
-            "status": "ok",
-            "verified": True,
-            "expected": expected,
-            "detected": detected,
-        }
-    else:
-        set_ticket_status(ticket_id, "mismatch")
-        result = {
-            "status": "mismatch",
-            "verified": False,
-            "expected": expected,
-            "detected": detected,
-            "missing": missing,
-            "extra": extra_items,
-        }
 
-    with open(f"verification_{ticket_id}.json", "w") as f:
-        json.dump(result, f)
+@app.get("/camera/tickets/{ticket_id}/detections")
+async def camera_ticket_detections(ticket_id: int):
+    """Camera detections for a ticket over time, oldest first."""
+    return {"ticketId": ticket_id, "detections": camera_timeline.get(ticket_id)}
 
-    return result
 
 @app.get("/ticket/{ticket_id}")
 def api_get_ticket(ticket_id: int):
@@ -0,0 +1,87 @@
+# backend/menu_cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+MENU_FILE = os.path.join(os.path.dirname(__file__), "menu", "menu.json")
+
+# how often (seconds) we stat menu.json to pick up edits without a restart
+MENU_RELOAD_INTERVAL = float(os.getenv("MENU_RELOAD_INTERVAL", "1.0"))
+
+
+class MenuSnapshot:
+    """
+    In-process copy of menu.json: parsed data, pre-encoded JSON body and
+    a content-hash ETag, so /menu never touches disk or the JSON encoder.
+    """
+
+    __slots__ = ("data", "body", "etag", "mtime")
+
+    def __init__(self, data: List[Dict[str, Any]], body: bytes, etag: str, mtime: float):
+        self.data = data
+        self.body = body
+        self.etag = etag
+        self.mtime = mtime
+
+
+_SNAPSHOT: Optional[MenuSnapshot] = None
+_LAST_CHECK = 0.0
+_LOCK = threading.Lock()
+
+
+def _build_snapshot(mtime: float) -> MenuSnapshot:
+    with open(MENU_FILE, "rb") as f:
+        raw = f.read()
+
+    data = json.loads(raw)
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return MenuSnapshot(data, body, etag, mtime)
+
+
+def get_menu_snapshot() -> MenuSnapshot:
+    """
+    Returns the current menu snapshot, reloading it if menu.json changed.
+    The file is stat'ed at most once per MENU_RELOAD_INTERVAL.
+    """
+    global _SNAPSHOT, _LAST_CHECK
+
+    now = time.monotonic()
+    snap = _SNAPSHOT
+    if snap is not None and now - _LAST_CHECK < MENU_RELOAD_INTERVAL:
+        return snap
+
+    with _LOCK:
+        snap = _SNAPSHOT
+        if snap is not None and now - _LAST_CHECK < MENU_RELOAD_INTERVAL:
+            return snap
+
+        try:
+            mtime = os.stat(MENU_FILE).st_mtime
+            if snap is None or mtime != snap.mtime:
+                snap = _build_snapshot(mtime)
+                _SNAPSHOT = snap
+        except (OSError, ValueError):
+            # half-written edit or file briefly gone (editor rename-over):
+            # keep serving the previous menu
+            if snap is None:
+                raise
+        _LAST_CHECK = now
+        return snap
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
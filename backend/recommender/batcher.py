@@ -0,0 +1,125 @@
+# recommender/batcher.py
+
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from logging_config.logger import get_logger
+reclog = get_logger("recommender")
+
+# a batch is flushed when it reaches MAX_SIZE or MAX_WAIT_MS after its first request
+RECOMMEND_BATCH_MAX_SIZE = int(os.getenv("RECOMMEND_BATCH_MAX_SIZE", "32"))
+RECOMMEND_BATCH_MAX_WAIT_MS = float(os.getenv("RECOMMEND_BATCH_MAX_WAIT_MS", "3"))
+
+
+class MicroBatcher:
+    """
+    Collects concurrent calls on the event loop and runs them through
+    `fn(items) -> results` as one batch on a dedicated worker thread, so
+    the model does one forward pass per batch and the loop never blocks.
+
+    While a batch is running, new requests queue up and form the next
+    batch, so batches grow with load and stay small (low latency) when idle.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_size: int = RECOMMEND_BATCH_MAX_SIZE,
+                 max_wait_ms: float = RECOMMEND_BATCH_MAX_WAIT_MS, name: str = "batcher"):
+        self.fn = fn
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+
+    def _running(self) -> bool:
+        return (
+            self._task is not None
+            and not self._task.done()
+            and self._loop is asyncio.get_running_loop()
+        )
+
+    def start(self):
+        if self._running():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def submit(self, item: Any) -> Any:
+        if not self._running():
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_size:
+            # take whatever is already queued without waiting
+            while len(batch) < self.max_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # callers that gave up (client disconnect / timeout) are skipped
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+            try:
+                results = await loop.run_in_executor(self._executor, self.fn, [item for item, _ in batch])
+            except Exception as e:
+                reclog.exception("Batch inference failed", extra={"batcher": self.name, "error": str(e)})
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_seen,
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,220 @@
+# recommender/cooccurrence.py
+#
+# Item co-occurrence learned from tickets: how often two items appear on
+# the same ticket. Updated in place as orders are inserted, so upsell
+# ("customers who ordered X also took Y") is a sparse row lookup per cart
+# item. Snapshotted to disk periodically; on start the snapshot is loaded
+# and only newer tickets are replayed from ticket_items. The model lives in
+# the API process, next to the inserts that feed it.
+
+import os
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from logging_config.logger import get_logger
+reclog = get_logger("recommender")
+
+from . import index_store
+
+COOCCURRENCE_SNAPSHOT = os.getenv(
+    "COOCCURRENCE_SNAPSHOT",
+    os.path.join(index_store.ARTIFACT_DIR, "cooccurrence.json"),
+)
+# pairs seen on fewer tickets than this are ignored as noise
+COOCCURRENCE_MIN_SUPPORT = int(os.getenv("COOCCURRENCE_MIN_SUPPORT", "3"))
+# confidence at or above which an item counts as a complement of the cart
+COOCCURRENCE_MIN_CONFIDENCE = float(os.getenv("COOCCURRENCE_MIN_CONFIDENCE", "0.2"))
+
+SNAPSHOT_VERSION = 1
+
+
+class CooccurrenceModel:
+    """
+    Sparse symmetric pair counts (item -> {other item -> tickets with both})
+    plus per-item ticket counts. confidence(a -> b) = pairs[a][b] / items[a].
+    """
+
+    def __init__(self, loading: bool = False):
+        self.tickets = 0
+        self.last_ticket_id = 0
+        self._items: Dict[str, int] = {}
+        self._pairs: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        # while replaying from the DB, live inserts are parked here
+        self._loading = loading
+        self._pending: List[Tuple[int, List[str]]] = []
+
+    # ---------------------------
+    # Updates
+    # ---------------------------
+    def _add(self, ticket_id: int, items: Iterable[str]):
+        unique = sorted(set(items))
+        self.tickets += 1
+        self.last_ticket_id = max(self.last_ticket_id, ticket_id)
+        for a in unique:
+            self._items[a] = self._items.get(a, 0) + 1
+        for i, a in enumerate(unique):
+            row_a = self._pairs.setdefault(a, {})
+            for b in unique[i + 1:]:
+                row_a[b] = row_a.get(b, 0) + 1
+                row_b = self._pairs.setdefault(b, {})
+                row_b[a] = row_b.get(a, 0) + 1
+        self._dirty = True
+
+    def add_ticket(self, ticket_id: int, items: Iterable[str]):
+        self.add_tickets([(ticket_id, items)])
+
+    def add_tickets(self, tickets: Iterable[Tuple[int, Iterable[str]]]):
+        with self._lock:
+            if self._loading:
+                self._pending.extend((tid, list(items)) for tid, items in tickets)
+                return
+            for ticket_id, items in tickets:
+                self._add(ticket_id, items)
+
+    def replay(self, rows: Iterable[Tuple[int, str]]):
+        """
+        Folds (ticket_id, item_id) rows ordered by ticket_id into the model.
+        Tickets inserted meanwhile are applied afterwards unless the replay
+        already covered them.
+        """
+        with self._lock:
+            self._loading = True
+        try:
+            # tickets up to here are already counted (snapshot) or in `rows`
+            current_id, current_items = None, []
+            for ticket_id, item_id in rows:
+                if ticket_id != current_id:
+                    if current_items:
+                        with self._lock:
+                            self._add(current_id, current_items)
+                    current_id, current_items = ticket_id, []
+                current_items.append(item_id)
+            if current_items:
+                with self._lock:
+                    self._add(current_id, current_items)
+        finally:
+            self.finish_loading()
+
+    def finish_loading(self):
+        """
+        Stops parking inserts and applies the parked tickets not already
+        counted. Safe to call more than once; the startup load calls it even
+        when reading the snapshot or the DB failed, so inserts are never
+        parked for good.
+        """
+        with self._lock:
+            if not self._loading:
+                return
+            self._loading = False
+            pending, self._pending = self._pending, []
+            for ticket_id, items in pending:
+                if ticket_id > self.last_ticket_id:
+                    self._add(ticket_id, items)
+
+    # ---------------------------
+    # Lookups
+    # ---------------------------
+    def complements(self, cart: Iterable[str]) -> Dict[str, float]:
+        """
+        item -> best confidence over the cart items, for items not already
+        in the cart with at least COOCCURRENCE_MIN_SUPPORT shared tickets.
+        """
+        cart = set(cart or ())
+        out: Dict[str, float] = {}
+        with self._lock:
+            for a in cart:
+                count_a = self._items.get(a)
+                if not count_a:
+                    continue
+                for b, n in self._pairs.get(a, {}).items():
+                    if n < COOCCURRENCE_MIN_SUPPORT or b in cart:
+                        continue
+                    conf = n / count_a
+                    if conf > out.get(b, 0.0):
+                        out[b] = conf
+        return out
+
+    def top_complements(self, cart: Iterable[str], k: int = 3) -> List[Tuple[str, float]]:
+        scores = self.complements(cart)
+        return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "tickets": self.tickets,
+                "items": len(self._items),
+                "pairs": sum(len(r) for r in self._pairs.values()) // 2,
+                "last_ticket_id": self.last_ticket_id,
+            }
+
+    # ---------------------------
+    # Snapshots
+    # ---------------------------
+    def save_snapshot(self, path: str = COOCCURRENCE_SNAPSHOT, force: bool = False) -> bool:
+        with self._lock:
+            if not (self._dirty or force):
+                return False
+            data = {
+                "version": SNAPSHOT_VERSION,
+                "tickets": self.tickets,
+                "last_ticket_id": self.last_ticket_id,
+                "items": dict(self._items),
+                "pairs": {a: dict(row) for a, row in self._pairs.items()},
+            }
+            self._dirty = False
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError as e:
+            self._dirty = True
+            reclog.warning("Could not save co-occurrence snapshot", extra={"path": path, "error": str(e)})
+            return False
+        return True
+
+    def load_snapshot(self, path: str = COOCCURRENCE_SNAPSHOT, max_ticket_id: Optional[int] = None) -> int:
+        """
+        Loads a snapshot and returns its last_ticket_id (0 if none). A
+        snapshot ahead of the DB (max_ticket_id) belongs to another DB and
+        is ignored, and so is a malformed one.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+
+        try:
+            if data["version"] != SNAPSHOT_VERSION:
+                return 0
+            tickets = int(data["tickets"])
+            last_ticket_id = int(data["last_ticket_id"])
+            items = {str(a): int(n) for a, n in data["items"].items()}
+            pairs = {
+                str(a): {str(b): int(n) for b, n in row.items()}
+                for a, row in data["pairs"].items()
+            }
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            reclog.warning("Ignoring malformed co-occurrence snapshot", extra={"path": path, "error": repr(e)})
+            return 0
+        if max_ticket_id is not None and last_ticket_id > max_ticket_id:
+            reclog.warning("Ignoring co-occurrence snapshot ahead of the DB", extra={"path": path})
+            return 0
+
+        with self._lock:
+            self.tickets = tickets
+            self.last_ticket_id = last_ticket_id
+            self._items = items
+            self._pairs = pairs
+            self._dirty = False
+        return self.last_ticket_id
+
+
+# the app's model parks inserts until its startup replay (see main.py) has run
+cooccurrence = CooccurrenceModel(loading=True)
@@ -2,9 +2,38 @@
 
 import json
 import os
+import sqlite3
+import threading
 from datetime import datetime
 from typing import List, Dict, Any
 
+from db import fetch_user_item_stats, fetch_user_item_stats_many
+from .cache import LRUCache
+
+# items per user considered "history", by recency-weighted score
+USER_HISTORY_ITEMS = int(os.getenv("USER_HISTORY_ITEMS", "10"))
+# returning customers' aggregates; entries are dropped when they order again
+_HISTORY_CACHE = LRUCache(
+    int(os.getenv("USER_HISTORY_CACHE_SIZE", "1024")),
+    float(os.getenv("USER_HISTORY_CACHE_TTL", "300")),
+)
+# invalidation generations, striped by user hash (bounded memory): a read
+# is cached only if its stripe wasn't bumped while the DB query ran, so a
+# query that raced an order's commit can't put pre-order history back
+_HISTORY_STRIPES = 4096
+_HISTORY_GENERATIONS = [0] * _HISTORY_STRIPES
+_HISTORY_LOCK = threading.Lock()
+
+
+def _history_generation(user_id: str) -> int:
+    return _HISTORY_GENERATIONS[hash(user_id) % _HISTORY_STRIPES]
+
+
+def _cache_history(user_id: str, stats: List[Dict[str, Any]], generation: int):
+    with _HISTORY_LOCK:
+        if _history_generation(user_id) == generation:
+            _HISTORY_CACHE.put(user_id, stats)
+
 MENU_FILE = os.path.join(os.path.dirname(__file__), "..", "menu", "menu.json")
 
 def load_menu():
@@ -35,15 +64,82 @@ def load_menu() -> List[Dict[str, Any]]:
     return MENU
 
 def load_inventory() -> Dict[str, bool]:
-    return MOCK_INVENTORY
+    # live availability (seeded from MOCK_INVENTORY, updated via /inventory)
+    from .inventory import inventory
+    return inventory.snapshot()
+
+def load_user_item_stats(user_id: str | None) -> List[Dict[str, Any]]:
+    """
+    Per-user aggregates (item_id, order_count, quantity, last_ordered_at,
+    recency-weighted score), best first. One primary-key range read of
+    user_item_stats, cached per user.
+    """
+    if not user_id or user_id == "anonymous":
+        return []
+
+    cached = _HISTORY_CACHE.get(user_id)
+    if cached is not None:
+        return cached
 
-def load_user_history(user_id: str) -> List[str]:
+    generation = _history_generation(user_id)
+    try:
+        stats = fetch_user_item_stats(user_id, USER_HISTORY_ITEMS)
+    except sqlite3.Error:
+        # schema not migrated yet (e.g. recommender used before DB startup)
+        return []
+    _cache_history(user_id, stats, generation)
+    return stats
+
+
+def load_user_item_stats_many(user_ids: List[str | None]) -> Dict[str, List[Dict[str, Any]]]:
+    """load_user_item_stats for many users: cache hits, then one query for all misses."""
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    misses = []
+    for user_id in user_ids:
+        if not user_id or user_id == "anonymous" or user_id in out:
+            continue
+        cached = _HISTORY_CACHE.get(user_id)
+        if cached is not None:
+            out[user_id] = cached
+        else:
+            misses.append(user_id)
+    if misses:
+        generations = {user_id: _history_generation(user_id) for user_id in misses}
+        try:
+            fetched = fetch_user_item_stats_many(misses, USER_HISTORY_ITEMS)
+        except sqlite3.Error:
+            fetched = {user_id: [] for user_id in misses}
+        for user_id, stats in fetched.items():
+            _cache_history(user_id, stats, generations[user_id])
+            out[user_id] = stats
+    return out
+
+
+def with_user_histories(requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Mock order history. You can later replace with real SQLite queries.
+    Adds each request's "history" (see load_user_history) so the reranker
+    doesn't read the DB per request; one lookup for the whole batch.
+    Call it where a DB read is fine (run_db, the batcher thread).
     """
-    mock_data = {
-        "anonymous": ["burger", "fries"],
-        "returning_user": ["cheese_burger", "cola"],
-        "veg_user": ["salad", "soup"],
-    }
-    return mock_data.get(user_id, [])
+    stats = load_user_item_stats_many([r.get("user") for r in requests if "history" not in r])
+    return [
+        r if "history" in r else {**r, "history": [s["item_id"] for s in stats.get(r.get("user"), [])]}
+        for r in requests
+    ]
+
+
+def load_user_history(user_id: str | None) -> List[str]:
+    """Item ids the user orders most, recency-weighted."""
+    return [s["item_id"] for s in load_user_item_stats(user_id)]
+
+
+def invalidate_user_history(user_id: str | None):
+    """Drops the cached history and retires reads of it still in flight."""
+    if user_id:
+        with _HISTORY_LOCK:
+            _HISTORY_GENERATIONS[hash(user_id) % _HISTORY_STRIPES] += 1
+            _HISTORY_CACHE.invalidate(user_id)
+
+
+def user_history_cache_stats() -> Dict[str, Any]:
+    return _HISTORY_CACHE.stats()
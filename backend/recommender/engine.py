@@ -3,8 +3,86 @@
 from typing import List, Dict, Any
 from datetime import datetime
 
-from .data_loader import load_menu, load_inventory, load_user_history
-from .rules import score_by_time, score_by_profile, score_by_history, score_by_inventory
+import numpy as np
+
+from .data_loader import load_menu, load_user_history
+from .rules import CompiledRules
+from .inventory import InventoryStore, inventory as inventory_store
+from .cooccurrence import cooccurrence
+
+# Upsell logic for the active ticket: (item in ticket, item to boost, bonus)
+UPSELL_RULES = [
+    ("burger", "fries", 8),
+    ("salad", "soup", 5),
+]
+
+# bonus for an item always ordered with the cart (confidence 1.0), scaled down by confidence
+LEARNED_UPSELL_BONUS = max(bonus for _, _, bonus in UPSELL_RULES)
+
+_COMPILED = None
+
+
+def compiled_rules(menu: List[Dict[str, Any]]) -> CompiledRules:
+    """Compiles the rules once per menu object (recompiled if the menu changes)."""
+    global _COMPILED
+    if _COMPILED is None or _COMPILED.menu is not menu:
+        _COMPILED = CompiledRules(menu)
+    return _COMPILED
+
+
+def upsell_scores(rules: CompiledRules, context_ticket_items: List[str] | None) -> np.ndarray:
+    out = np.zeros(len(rules), dtype=np.int32)
+    if context_ticket_items:
+        for trigger, target, bonus in UPSELL_RULES:
+            i = rules.index.get(target)
+            if i is not None and trigger in context_ticket_items:
+                out[i] += bonus
+        # combos learned from ticket history (recommender/cooccurrence.py)
+        for item_id, conf in cooccurrence.complements(context_ticket_items).items():
+            i = rules.index.get(item_id)
+            if i is not None:
+                out[i] += int(round(LEARNED_UPSELL_BONUS * conf))
+    return out
+
+
+def top_k_stable(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k best scores, highest first, ties kept in menu order
+    (same result as a stable descending sort) without sorting everything.
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        kth = np.partition(scores, n - k)[n - k]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(n)
+    order = np.argsort(-scores[candidates], kind="stable")
+    return candidates[order[:k]]
+
+
+def score_items(
+    menu: List[Dict[str, Any]],
+    hour: int,
+    profile: str,
+    history: List[str],
+    inventory: Dict[str, bool] | InventoryStore,
+    context_ticket_items: List[str] | None = None,
+) -> np.ndarray:
+    rules = compiled_rules(menu)
+    if isinstance(inventory, InventoryStore):
+        inventory_scores = rules.store_inventory_scores(inventory)
+    else:
+        inventory_scores = rules.inventory_scores(inventory)
+    return (
+        rules.time_scores(hour)
+        + rules.profile_scores(profile)
+        + rules.history_scores(history)
+        + inventory_scores
+        + upsell_scores(rules, context_ticket_items)
+    )
 
 
 def get_recommendations(
@@ -15,7 +93,6 @@ def get_recommendations(
 ) -> List[Dict[str, Any]]:
 
     menu = load_menu()
-    inventory = load_inventory()
     history = load_user_history(user)
 
     # Determine time-of-day
@@ -27,35 +104,16 @@ def get_recommendations(
     else:
         hour = datetime.now().hour
 
-    scored_items = []
-
-    for item in menu:
-        base_score = 0
-        base_score += score_by_time(item, hour)
-        base_score += score_by_profile(item, profile)
-        base_score += score_by_history(item, history)
-        base_score += score_by_inventory(item["id"], inventory)
-
-        # Upsell logic for the active ticket
-        if context_ticket_items:
-            if "burger" in context_ticket_items and item["id"] == "fries":
-                base_score += 8
-            if "salad" in context_ticket_items and item["id"] == "soup":
-                base_score += 5
-
-        scored_items.append((item, base_score))
-
-    # Sort by descending score
-    sorted_items = sorted(scored_items, key=lambda x: x[1], reverse=True)
+    scores = score_items(menu, hour, profile, history, inventory_store, context_ticket_items)
 
     # Convert to final output (top 3 items)
     recommendations = [
         {
-            "id": item["id"],
-            "name": item["name"],
+            "id": menu[i]["id"],
+            "name": menu[i]["name"],
             "reason": "Recommended based on context"
         }
-        for item, score in sorted_items[:3]
+        for i in top_k_stable(scores, 3)
     ]
 
     return recommendations
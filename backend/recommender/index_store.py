@@ -0,0 +1,104 @@
+# recommender/index_store.py
+#
+# On-disk index artifacts, keyed by a content hash of the menu corpus and
+# the embedding model. Embeddings are loaded memory-mapped, so every
+# uvicorn worker on a host shares the same read-only page-cache pages and
+# restarts skip re-encoding the menu.
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from typing import List, Optional
+
+from logging_config.logger import get_logger
+reclog = get_logger("recommender")
+
+ARTIFACT_DIR = os.getenv(
+    "INDEX_ARTIFACT_DIR",
+    os.path.join(os.path.dirname(__file__), "artifacts"),
+)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+FAISS_FILE = "index.faiss"
+META_FILE = "meta.json"
+
+# bump when the stored format changes (2: L2-normalized embeddings, IndexFlatIP)
+ARTIFACT_VERSION = 2
+
+
+def corpus_key(corpus: List[str], ids: List[str], model_name: str) -> str:
+    h = hashlib.sha256()
+    h.update(f"v{ARTIFACT_VERSION}:{model_name}".encode("utf-8"))
+    for item_id, text in zip(ids, corpus):
+        h.update(b"\0" + item_id.encode("utf-8") + b"\0" + text.encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
+def artifact_path(key: str) -> str:
+    return os.path.join(ARTIFACT_DIR, key)
+
+
+def load_embeddings(key: str) -> Optional[np.ndarray]:
+    path = os.path.join(artifact_path(key), EMBEDDINGS_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        emb = np.load(path, mmap_mode="r")
+    except (OSError, ValueError) as e:
+        reclog.warning("Ignoring unreadable index artifact", extra={"path": path, "error": str(e)})
+        return None
+    reclog.info("Loaded memory-mapped embeddings", extra={"path": path, "shape": list(emb.shape)})
+    return emb
+
+
+def load_faiss_index(key: str, faiss_module):
+    path = os.path.join(artifact_path(key), FAISS_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        flags = faiss_module.IO_FLAG_MMAP | faiss_module.IO_FLAG_READ_ONLY
+        return faiss_module.read_index(path, flags)
+    except Exception:
+        # index types without mmap support are read into memory
+        return faiss_module.read_index(path)
+
+
+def save_artifacts(key: str, ids: List[str], model_name: str, embeddings: np.ndarray,
+                   faiss_index=None, faiss_module=None):
+    """
+    Writes into a temp dir and renames it into place, so concurrent
+    workers never see a half-written artifact.
+    """
+    final = artifact_path(key)
+    if os.path.exists(final):
+        faiss_path = os.path.join(final, FAISS_FILE)
+        if faiss_index is not None and faiss_module is not None and not os.path.exists(faiss_path):
+            # embeddings were saved by a non-FAISS backend; add the index next to them
+            tmp_path = f"{faiss_path}.{os.getpid()}.tmp"
+            try:
+                faiss_module.write_index(faiss_index, tmp_path)
+                os.replace(tmp_path, faiss_path)
+            except OSError as e:
+                reclog.warning("Could not save FAISS index", extra={"path": faiss_path, "error": str(e)})
+        return
+
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{key}-", dir=ARTIFACT_DIR)
+    try:
+        # readable by workers running as other users
+        os.chmod(tmp, 0o755)
+        np.save(os.path.join(tmp, EMBEDDINGS_FILE), np.ascontiguousarray(embeddings, dtype="float32"))
+        if faiss_index is not None and faiss_module is not None:
+            faiss_module.write_index(faiss_index, os.path.join(tmp, FAISS_FILE))
+        with open(os.path.join(tmp, META_FILE), "w") as f:
+            json.dump({"ids": ids, "model": model_name, "dim": int(embeddings.shape[1])}, f)
+        os.rename(tmp, final)
+        reclog.info("Saved index artifacts", extra={"path": final})
+    except OSError as e:
+        # another worker won the race, or the dir is read-only: not fatal
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(final):
+            reclog.warning("Could not save index artifacts", extra={"path": final, "error": str(e)})
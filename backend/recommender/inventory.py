@@ -0,0 +1,80 @@
+# recommender/inventory.py
+
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+from .data_loader import MOCK_INVENTORY
+
+
+class InventoryStore:
+    """
+    Live item availability. Besides the id -> bool map it keeps a bool
+    bitmap aligned with the vector index row order, so search can mask
+    sold-out rows in one NumPy op. Updates swap in a new bitmap (readers
+    never see a half-applied change) and bump `version`, which result
+    caches include in their keys.
+    Items the store has never heard of count as available.
+    """
+
+    def __init__(self, initial: Optional[Dict[str, bool]] = None):
+        self._state: Dict[str, bool] = dict(initial or {})
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        # (bitmap, unavailable_count), swapped as one tuple
+        self._current = (np.ones(0, dtype=bool), 0)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def align(self, ids: List[str]):
+        """Re-aligns the bitmap with a (re)built index's row order."""
+        with self._lock:
+            # kept by identity: bitmap() realigns when the index swaps its id list
+            self._ids = ids
+            self._rows = {item_id: i for i, item_id in enumerate(self._ids)}
+            self._rebuild_bitmap()
+
+    def _rebuild_bitmap(self):
+        bitmap = np.fromiter(
+            (self._state.get(item_id, True) for item_id in self._ids),
+            dtype=bool, count=len(self._ids),
+        )
+        bitmap.setflags(write=False)
+        self._current = (bitmap, int(len(bitmap) - bitmap.sum()))
+        self.version += 1
+
+    def set_many(self, updates: Dict[str, bool]) -> int:
+        with self._lock:
+            changed = {k: bool(v) for k, v in updates.items() if self._state.get(k, True) != bool(v)}
+            self._state.update({k: bool(v) for k, v in updates.items()})
+            if changed:
+                self._rebuild_bitmap()
+            return self.version
+
+    def set_available(self, item_id: str, available: bool) -> int:
+        return self.set_many({item_id: available})
+
+    def is_available(self, item_id: str) -> bool:
+        return self._state.get(item_id, True)
+
+    def bitmap(self, ids: List[str]):
+        """
+        (bitmap, unavailable_count) for the given index row order; the
+        bitmap is read-only and shared, so callers must not modify it.
+        """
+        if ids is not self._ids:
+            self.align(ids)
+        return self._current
+
+    def filter_ids(self, records: Iterable[Dict], key: str = "id") -> List[Dict]:
+        return [r for r in records if self.is_available(r[key])]
+
+    def snapshot(self) -> Dict[str, bool]:
+        with self._lock:
+            out = {item_id: True for item_id in self._ids}
+            out.update(self._state)
+            return out
+
+
+# seeded from the mock feed; the POS / kitchen 86es items through the API
+inventory = InventoryStore(MOCK_INVENTORY)
@@ -0,0 +1,96 @@
+# recommender/materialized.py
+#
+# Precomputed recommendations for context-free requests (no ticket, no
+# known user): one table entry per (store, profile, time-of-day), so the
+# hot path is a dict read. Rebuilt in the background whenever the index,
+# the inventory or the menu changes; while an entry is stale, get()
+# returns None and callers fall back to the live recommender.
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logging_config.logger import get_logger
+reclog = get_logger("recommender")
+
+from .rules import hour_of
+from .inventory import inventory
+from .vector_index import index_generation
+from .vector_recommender import _build_query_text, _search, _explain
+
+# this process serves one store; requests for other stores take the live path
+STORE_ID = os.getenv("STORE_ID", "default")
+MATERIALIZED_PROFILES = [
+    p.strip() for p in os.getenv("MATERIALIZED_PROFILES", "returning,new,veg,in_store").split(",") if p.strip()
+]
+MATERIALIZED_TOP_K = int(os.getenv("MATERIALIZED_TOP_K", "3"))
+
+
+class MaterializedRecs:
+    """
+    Table key: (store, profile, has_timestamp, hour). The hour rather than
+    the daypart, because the time-of-day rule windows don't line up with
+    the dayparts used in the query text; 24 rows per profile is still tiny.
+    """
+
+    def __init__(self, profiles: List[str], stores: List[str], top_k: int = MATERIALIZED_TOP_K,
+                 extra_version: Optional[Callable[[], Any]] = None):
+        self.profiles = profiles
+        self.stores = stores
+        self.top_k = top_k
+        # e.g. the menu snapshot's ETag; part of the freshness check
+        self.extra_version = extra_version
+        self._table: Dict[Tuple, List[Dict[str, Any]]] = {}
+        self._version: Optional[Tuple] = None
+        self._refresh_lock = threading.Lock()
+        self.refreshes = 0
+
+    def current_version(self) -> Tuple:
+        extra = self.extra_version() if self.extra_version else None
+        return (index_generation(), inventory.version, extra)
+
+    def is_fresh(self) -> bool:
+        return self._version is not None and self._version == self.current_version()
+
+    def get(self, store: Optional[str], profile: str, timestamp: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        if not self.is_fresh():
+            return None
+        return self._table.get((store or STORE_ID, profile, bool(timestamp), hour_of(timestamp)))
+
+    def refresh(self, force: bool = False) -> bool:
+        """Recomputes the whole table in one batched search if anything changed."""
+        with self._refresh_lock:
+            version = self.current_version()
+            if not force and version == self._version:
+                return False
+
+            keys, query_texts, contexts = [], [], []
+            for profile in self.profiles:
+                for has_time in (True, False):
+                    for hour in range(24):
+                        ts = f"2000-01-01T{hour:02d}:00:00"
+                        keys.append((profile, has_time, hour))
+                        query_texts.append(_build_query_text(profile, ts if has_time else None, None))
+                        # the time rule always sees the hour the entry is served at
+                        contexts.append({"user": None, "profile": profile, "timestamp": ts})
+
+            results = _search(query_texts, contexts, self.top_k)
+            table = {}
+            for (profile, has_time, hour), res in zip(keys, results):
+                recs = _explain(res, None)
+                for store in self.stores:
+                    table[(store, profile, has_time, hour)] = recs
+
+            # swap both at once; readers see the old or the new table, never a mix
+            self._table = table
+            self._version = version
+            self.refreshes += 1
+            reclog.info("Materialized recommendations refreshed", extra={"entries": len(table), "version": str(version)})
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._table),
+            "fresh": self.is_fresh(),
+            "refreshes": self.refreshes,
+        }
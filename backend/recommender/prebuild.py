@@ -0,0 +1,36 @@
+# recommender/prebuild.py
+#
+# Builds the vector index once and writes its artifacts to INDEX_ARTIFACT_DIR.
+# Run once per deployment and again when the menu or embedding model changes:
+#   python -m recommender.prebuild
+
+import sys
+import argparse
+
+from . import vector_index, index_store
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Prebuild recommender index artifacts")
+    parser.add_argument(
+        "--backend",
+        choices=["sentence-faiss", "sentence-nn", "tfidf-nn"],
+        default=vector_index.VECTOR_BACKEND,
+        help="backend to build (default: best available)",
+    )
+    args = parser.parse_args(argv)
+
+    vector_index.VECTOR_BACKEND = args.backend
+    vector_index.build_index(force=True)
+
+    method = vector_index._EMB_METHOD
+    if vector_index._INDEX_KEY is None:
+        print(f"backend={method}: nothing to persist (TF-IDF is fit at startup)")
+        return 0
+
+    print(f"backend={method} artifacts={index_store.artifact_path(vector_index._INDEX_KEY)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
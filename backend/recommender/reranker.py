@@ -0,0 +1,144 @@
+# recommender/reranker.py
+#
+# Hybrid re-ranking: the vector search proposes a candidate set, which is
+# re-scored with the business rules from rules.py (daypart, profile, order
+# history, combo upsell incl. combos learned from tickets) next to the
+# cosine similarity. Cost per request is candidates x features; nothing
+# here scans the whole menu.
+
+import os
+import threading
+import numpy as np
+from typing import List, Dict, Any, Tuple
+
+from .rules import CompiledRules, hour_of
+from .engine import UPSELL_RULES
+from .cooccurrence import cooccurrence
+from .data_loader import load_user_history
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "1") != "0"
+# candidates pulled from the vector search per request before re-ranking
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+
+FEATURES = ("similarity", "time", "profile", "history", "upsell")
+
+# rule features are scaled to [0, 1] before weighting, similarity is cosine
+DEFAULT_WEIGHTS = {
+    "similarity": float(os.getenv("RERANK_W_SIMILARITY", "1.0")),
+    "time": float(os.getenv("RERANK_W_TIME", "0.3")),
+    "profile": float(os.getenv("RERANK_W_PROFILE", "0.2")),
+    "history": float(os.getenv("RERANK_W_HISTORY", "0.3")),
+    "upsell": float(os.getenv("RERANK_W_UPSELL", "0.5")),
+}
+
+_RULES = None
+_RULES_LOCK = threading.Lock()
+
+
+def weight_vector(weights: Dict[str, float] | None = None) -> np.ndarray:
+    merged = {**DEFAULT_WEIGHTS, **(weights or {})}
+    return np.array([merged[f] for f in FEATURES], dtype=np.float32)
+
+
+def rules_for(meta: List[Dict[str, Any]]) -> CompiledRules:
+    """Rules compiled against the index's item list, so columns line up with index rows."""
+    global _RULES
+    rules = _RULES
+    if rules is None or rules.menu is not meta:
+        with _RULES_LOCK:
+            if _RULES is None or _RULES.menu is not meta:
+                _RULES = CompiledRules(meta)
+            rules = _RULES
+    return rules
+
+
+def _scaled(values: np.ndarray, scale: float) -> np.ndarray:
+    return values.astype(np.float32) / scale if scale > 0 else values.astype(np.float32)
+
+
+def feature_matrix(rules: CompiledRules, rows: np.ndarray, sims: np.ndarray,
+                   contexts: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    (n_queries, n_candidates, n_features) matrix. rows/sims are the padded
+    candidate index rows and similarities (row -1 = empty slot).
+    """
+    n_q, n_c = rows.shape
+    feats = np.zeros((n_q, n_c, len(FEATURES)), dtype=np.float32)
+    feats[:, :, 0] = sims
+    safe = np.maximum(rows, 0)
+
+    time_scale = float(rules.hour_table.max()) if len(rules) else 1.0
+    for q, ctx in enumerate(contexts):
+        r = safe[q]
+        history = ctx.get("history") or []
+        cart = ctx.get("context_ticket_items") or []
+
+        feats[q, :, 1] = _scaled(rules.time_scores(hour_of(ctx.get("timestamp")))[r], time_scale)
+
+        profile = rules.profile_scores(ctx.get("profile") or "returning")
+        feats[q, :, 2] = _scaled(profile[r], float(profile.max()) if len(profile) else 1.0)
+
+        hist = rules.history_scores_at(history, r)
+        feats[q, :, 3] = _scaled(hist, float(hist.max()) if n_c else 1.0)
+
+        if cart:
+            upsell = np.zeros(n_c, dtype=np.float32)
+            for trigger, target, bonus in UPSELL_RULES:
+                target_row = rules.index.get(target)
+                if target_row is not None and trigger in cart:
+                    upsell[r == target_row] += bonus
+            upsell = _scaled(upsell, float(max(b for _, _, b in UPSELL_RULES)))
+            # learned combos: confidence of each candidate given the cart, sparse row lookup
+            learned = ctx.get("complements")
+            if learned:
+                conf = np.fromiter((learned.get(rules.ids[i], 0.0) for i in r), dtype=np.float32, count=n_c)
+                upsell = np.maximum(upsell, conf)
+            feats[q, :, 4] = upsell
+
+    return feats
+
+
+def rerank(
+    candidates: List[List[Tuple[Dict[str, Any], float]]],
+    contexts: List[Dict[str, Any]],
+    meta: List[Dict[str, Any]],
+    top_k: int = 3,
+    weights: Dict[str, float] | None = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Re-orders each query's (item meta, similarity) candidates by the
+    weighted sum of similarity and rule features and keeps the top_k.
+    contexts hold the request fields (user, profile, timestamp,
+    context_ticket_items, and optionally the prefetched history), one per
+    query.
+    """
+    if not candidates:
+        return []
+
+    rules = rules_for(meta)
+    n_c = max(len(c) for c in candidates)
+    rows = np.full((len(candidates), n_c), -1, dtype=np.int64)
+    sims = np.zeros((len(candidates), n_c), dtype=np.float32)
+    for q, cands in enumerate(candidates):
+        for j, (item, score) in enumerate(cands):
+            rows[q, j] = rules.index.get(item["id"], -1)
+            sims[q, j] = score
+
+    contexts = [
+        {
+            **ctx,
+            # callers prefetch histories for the batch (data_loader.with_user_histories)
+            "history": ctx["history"] if "history" in ctx else load_user_history(ctx.get("user") or "anonymous"),
+            "complements": cooccurrence.complements(ctx.get("context_ticket_items")),
+        }
+        for ctx in contexts
+    ]
+    totals = feature_matrix(rules, rows, sims, contexts) @ weight_vector(weights)
+    totals[rows < 0] = -np.inf
+
+    # stable: equal totals keep the similarity order
+    order = np.argsort(-totals, axis=1, kind="stable")[:, :top_k]
+    out = []
+    for q, idx in enumerate(order):
+        out.append([meta[rows[q, j]] for j in idx if rows[q, j] >= 0])
+    return out
@@ -1,7 +1,16 @@
 # recommender/rules.py
 
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+def hour_of(timestamp: str | None) -> int:
+    """Hour of an ISO timestamp; the current hour if missing or unparseable."""
+    try:
+        return datetime.fromisoformat(timestamp).hour if timestamp else datetime.now().hour
+    except ValueError:
+        return datetime.now().hour
 
 def score_by_time(item: Dict[str, Any], hour: int) -> int:
     # breakfast: soup & salad isn't ideal
@@ -32,3 +41,126 @@ def score_by_history(item: Dict[str, Any], history: List[str]) -> int:
 
 def score_by_inventory(item_id: str, inventory: Dict[str, bool]) -> int:
     return 5 if inventory.get(item_id, False) else -999  # hide unavailable items
+
+
+# ---------------------------
+# Compiled (vectorized) form of the rules above
+# ---------------------------
+
+class CompiledRules:
+    """
+    The rules above compiled once per menu: a tag bitmask matrix, a
+    (24, n_items) per-hour score table and cached per-profile vectors, so
+    scoring every item is a handful of NumPy ops instead of a Python loop.
+    Keep in step with the scalar functions (bench/bench_rules.py checks parity).
+    """
+
+    def __init__(self, menu: List[Dict[str, Any]]):
+        self.menu = menu
+        self.ids = [it["id"] for it in menu]
+        self.id_array = np.array(self.ids, dtype=object)
+        self.index = {item_id: i for i, item_id in enumerate(self.ids)}
+
+        tags = sorted({t for it in menu for t in it.get("tags", [])})
+        self.tag_index = {t: i for i, t in enumerate(tags)}
+        self.tag_mask = np.zeros((len(tags), len(menu)), dtype=bool)
+        for col, it in enumerate(menu):
+            for t in it.get("tags", []):
+                self.tag_mask[self.tag_index[t], col] = True
+
+        self.hour_table = np.stack([self._time_scores(h) for h in range(24)])
+        self._profile_cache: Dict[str, np.ndarray] = {}
+        # (store, store version, scores) for the live inventory
+        self._inventory_cache: Optional[tuple] = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def has_tag(self, tag: str) -> np.ndarray:
+        row = self.tag_index.get(tag)
+        if row is None:
+            return np.zeros(len(self.ids), dtype=bool)
+        return self.tag_mask[row]
+
+    def item_mask(self, item_ids) -> np.ndarray:
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for item_id in item_ids:
+            i = self.index.get(item_id)
+            if i is not None:
+                mask[i] = True
+        return mask
+
+    # score_by_time
+    def _time_scores(self, hour: int) -> np.ndarray:
+        out = np.ones(len(self.ids), dtype=np.int32)
+        if 7 <= hour <= 10:
+            out[self.has_tag("light")] = 2
+        elif 11 <= hour <= 14:
+            out[self.has_tag("main")] = 5
+        elif 18 <= hour <= 21:
+            out[self.has_tag("hot")] = 3
+        return out
+
+    def time_scores(self, hour: int) -> np.ndarray:
+        return self.hour_table[hour % 24]
+
+    # score_by_profile
+    def profile_scores(self, profile: str) -> np.ndarray:
+        cached = self._profile_cache.get(profile)
+        if cached is not None:
+            return cached
+
+        if profile == "veg":
+            out = np.where(self.has_tag("veg"), 7, 1).astype(np.int32)
+        elif profile == "new":
+            out = np.full(len(self.ids), 2, dtype=np.int32)
+        elif profile == "returning":
+            out = np.full(len(self.ids), 3, dtype=np.int32)
+        else:
+            out = np.ones(len(self.ids), dtype=np.int32)
+
+        if len(self._profile_cache) < 256:
+            self._profile_cache[profile] = out
+        return out
+
+    # score_by_history
+    def history_scores(self, history: List[str]) -> np.ndarray:
+        out = np.ones(len(self.ids), dtype=np.int32)
+        if "burger" in history:
+            fries = self.index.get("fries")
+            if fries is not None:
+                out[fries] = 6
+        out[self.item_mask(history)] = 4
+        return out
+
+    def history_scores_at(self, history: List[str], rows: np.ndarray) -> np.ndarray:
+        """history_scores(history)[rows] without touching the other items."""
+        out = np.ones(rows.shape, dtype=np.int32)
+        if "burger" in history and "fries" in self.index:
+            out[rows == self.index["fries"]] = 6
+        hist_rows = [self.index[h] for h in history if h in self.index]
+        if hist_rows:
+            out[np.isin(rows, hist_rows)] = 4
+        return out
+
+    # score_by_inventory
+    def inventory_scores(self, inventory: Dict[str, bool]) -> np.ndarray:
+        available = np.fromiter(
+            (bool(inventory.get(item_id, False)) for item_id in self.ids),
+            dtype=bool, count=len(self.ids),
+        )
+        return np.where(available, 5, -999).astype(np.int32)
+
+    def store_inventory_scores(self, store) -> np.ndarray:
+        """
+        inventory_scores() for an InventoryStore, rebuilt only when the
+        store's version changes, so requests between two 86es share it.
+        """
+        version = store.version
+        cached = self._inventory_cache
+        if cached is not None and cached[0] is store and cached[1] == version:
+            return cached[2]
+        out = self.inventory_scores(store.snapshot())
+        out.setflags(write=False)
+        self._inventory_cache = (store, version, out)
+        return out
@@ -2,27 +2,35 @@
 
 import os
 import json
+import threading
+import importlib.util
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
-# try FAISS + SentenceTransformer, else fallback to sklearn
-try:
-    import faiss
-    FAISS_AVAILABLE = True
-except Exception:
-    FAISS_AVAILABLE = False
+# FAISS / sentence-transformers / sklearn are heavy to import, so they are
+# only probed here and imported by build_index() (see _import_backends).
+FAISS_AVAILABLE = importlib.util.find_spec("faiss") is not None
+ST_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
 
-try:
-    from sentence_transformers import SentenceTransformer
-    ST_AVAILABLE = True
-except Exception:
-    ST_AVAILABLE = False
-
-# Fallback tools
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.neighbors import NearestNeighbors
+faiss = None
+SentenceTransformer = None
 
 from .data_loader import load_menu
+from .cache import LRUCache
+from .inventory import inventory
+from . import index_store
+
+# Force a backend ("sentence-faiss", "sentence-nn", "tfidf-nn"); falls back
+# to the best available one if its dependencies are missing.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND")
+
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+
+# Query-embedding and top-k result caches (cleared on build_index(force=True))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "900"))
+_EMB_CACHE = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+_RESULT_CACHE = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
 
 # Globals to hold index & metadata
 _INDEX = None
@@ -31,9 +39,32 @@ _ITEM_IDS = []
 _ITEM_META = []
 _VECTOR_DIM = None
 _TFIDF_VECT = None
-_NN_MODEL = None
 _ST_MODEL = None
 _FAISS_INDEX = None
+_INDEX_KEY = None
+# bumped on every (re)build so derived tables know to refresh
+_INDEX_GENERATION = 0
+_BUILD_LOCK = threading.RLock()
+
+
+def _import_backends():
+    """Imports FAISS / SentenceTransformer on first build; a failed import disables that backend."""
+    global faiss, SentenceTransformer, FAISS_AVAILABLE, ST_AVAILABLE
+
+    if FAISS_AVAILABLE and faiss is None:
+        try:
+            import faiss as _faiss
+            faiss = _faiss
+        except Exception:
+            FAISS_AVAILABLE = False
+
+    if ST_AVAILABLE and SentenceTransformer is None:
+        try:
+            from sentence_transformers import SentenceTransformer as _ST
+            SentenceTransformer = _ST
+        except Exception:
+            ST_AVAILABLE = False
+
 
 def _menu_corpus():
     menu = load_menu()
@@ -47,94 +78,309 @@ def _menu_corpus():
         meta.append(it)
     return ids, meta, corpus
 
-def build_index(force=False):
-    global _INDEX, _ITEM_IDS, _ITEM_META, _VECTOR_DIM, _TFIDF_VECT, _NN_MODEL, _ST_MODEL, _FAISS_INDEX, _EMB_METHOD
+def _load_st_model():
+    global _ST_MODEL
+    if _ST_MODEL is None:
+        # load model (small one for speed)
+        _ST_MODEL = SentenceTransformer(EMBED_MODEL_NAME)
+    return _ST_MODEL
+
+
+def _menu_embeddings(ids, corpus):
+    """
+    L2-normalized menu embeddings from the on-disk artifact (memory-mapped)
+    if one exists for this menu + model, else encoded now and saved for the
+    next start.
+    """
+    key = index_store.corpus_key(corpus, ids, EMBED_MODEL_NAME)
+    embeddings = index_store.load_embeddings(key)
+    if embeddings is None:
+        embeddings = _load_st_model().encode(corpus, convert_to_numpy=True, show_progress_bar=False)
+        embeddings = l2_normalize(np.asarray(embeddings, dtype='float32'))
+    return key, embeddings
+
+
+# ---------------------------
+# Exact top-k search engine
+# ---------------------------
+
+def l2_normalize(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype='float32')
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def topk_rows(scores: np.ndarray, k: int):
+    """
+    Row-wise top-k of a (n_queries, n_items) score matrix: argpartition,
+    then sort only the k survivors. Returns (indices, scores), best first.
+    """
+    n_items = scores.shape[1]
+    k = min(k, n_items)
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
 
+    if k < n_items:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(n_items), scores.shape).copy()
+
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class TopKIndex:
+    """
+    Cosine-similarity search over L2-normalized item vectors (a contiguous
+    float32 matrix; TF-IDF items stay CSR): one matrix product per query
+    batch plus a partial top-k. Queries may be dense or scipy-sparse rows.
+    """
+
+    def __init__(self, items, normalized: bool = False):
+        self.sparse = hasattr(items, "toarray")
+        if self.sparse:
+            # TF-IDF: keep it sparse, sparse x sparse is far cheaper than densifying
+            from scipy.sparse import diags
+            items = items.astype('float32').tocsr()
+            if not normalized:
+                norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+                norms[norms == 0] = 1.0
+                items = (diags(1.0 / norms) @ items).astype('float32').tocsr()
+            self.matrix = items
+            self._matrix_t = items.T.tocsr()
+        else:
+            # an already-normalized (e.g. memory-mapped) matrix is used as-is, without a copy
+            self.matrix = items if normalized else l2_normalize(items)
+            self._matrix_t = self.matrix.T
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def scores(self, queries) -> np.ndarray:
+        if hasattr(queries, "toarray"):
+            sims = queries @ self._matrix_t
+            sims = sims.toarray() if hasattr(sims, "toarray") else np.asarray(sims)
+            sims = sims.astype('float32', copy=False)
+            norms = np.sqrt(np.asarray(queries.multiply(queries).sum(axis=1), dtype='float32'))
+        else:
+            queries = np.asarray(queries, dtype='float32')
+            if self.sparse:
+                sims = np.asarray((self.matrix @ queries.T).T, dtype='float32')
+            else:
+                sims = queries @ self._matrix_t
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return sims / norms
+
+    def search(self, queries, k: int):
+        return topk_rows(self.scores(queries), k)
+
+
+def build_index(force=False):
+    global _INDEX_GENERATION
     if _INDEX is not None and not force:
         return
 
+    # concurrent first requests / warmup must not build the index twice
+    with _BUILD_LOCK:
+        if _INDEX is not None and not force:
+            return
+        _build_index()
+        _INDEX_GENERATION += 1
+
+
+def is_ready() -> bool:
+    return _INDEX is not None
+
+
+def index_generation() -> int:
+    return _INDEX_GENERATION
+
+
+def item_meta() -> List[Dict[str, Any]]:
+    """Item metadata in index row order (replaced, never mutated, on rebuild)."""
+    build_index()
+    return _ITEM_META
+
+
+def _build_index():
+    global _INDEX, _ITEM_IDS, _ITEM_META, _VECTOR_DIM, _TFIDF_VECT, _ST_MODEL, _FAISS_INDEX, _EMB_METHOD, _INDEX_KEY
+
+    _import_backends()
+
+    # cached embeddings / results belong to the old index
+    _EMB_CACHE.clear()
+    _RESULT_CACHE.clear()
+
     ids, meta, corpus = _menu_corpus()
     _ITEM_IDS = ids
     _ITEM_META = meta
+    inventory.align(ids)
+
+    want = VECTOR_BACKEND
+    use_st = ST_AVAILABLE and want in (None, "sentence-faiss", "sentence-nn")
+    use_faiss = FAISS_AVAILABLE and want in (None, "sentence-faiss")
 
     # Prefer sentence-transformers + faiss
-    if ST_AVAILABLE and FAISS_AVAILABLE:
+    if use_st and use_faiss:
         _EMB_METHOD = "sentence-faiss"
-        # load model (small one for speed)
-        _ST_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
-        embeddings = _ST_MODEL.encode(corpus, convert_to_numpy=True, show_progress_bar=False)
-        embeddings = embeddings.astype('float32')
+        key, embeddings = _menu_embeddings(ids, corpus)
         _VECTOR_DIM = embeddings.shape[1]
-        # build FAISS index (L2)
-        index = faiss.IndexFlatL2(_VECTOR_DIM)
-        index.add(embeddings)
+        index = index_store.load_faiss_index(key, faiss)
+        if index is None:
+            # inner product on normalized vectors == cosine similarity
+            index = faiss.IndexFlatIP(_VECTOR_DIM)
+            index.add(np.ascontiguousarray(embeddings))
+            index_store.save_artifacts(key, ids, EMBED_MODEL_NAME, embeddings, index, faiss)
+        _load_st_model()
+        _INDEX_KEY = key
         _FAISS_INDEX = index
         _INDEX = index
         return
 
-    # If faiss missing but sentence-transformers available -> use sklearn NN on dense embeddings
-    if ST_AVAILABLE and not FAISS_AVAILABLE:
+    # If faiss missing but sentence-transformers available -> NumPy top-k on dense embeddings
+    if use_st:
         _EMB_METHOD = "sentence-nn"
-        _ST_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
-        embeddings = _ST_MODEL.encode(corpus, convert_to_numpy=True, show_progress_bar=False)
+        key, embeddings = _menu_embeddings(ids, corpus)
+        index_store.save_artifacts(key, ids, EMBED_MODEL_NAME, embeddings)
+        _load_st_model()
+        _INDEX_KEY = key
         _VECTOR_DIM = embeddings.shape[1]
-        _NN_MODEL = NearestNeighbors(n_neighbors=min(10, len(corpus)), metric='cosine').fit(embeddings)
-        _INDEX = (_NN_MODEL, embeddings)
+        _INDEX = TopKIndex(embeddings, normalized=True)
         return
 
-    # Fallback: TF-IDF + sklearn NearestNeighbors
+    # Fallback: TF-IDF + NumPy top-k (cheap to fit, not persisted)
+    from sklearn.feature_extraction.text import TfidfVectorizer
     _EMB_METHOD = "tfidf-nn"
+    _INDEX_KEY = None
     _TFIDF_VECT = TfidfVectorizer(max_features=512)
     X = _TFIDF_VECT.fit_transform(corpus)
     _VECTOR_DIM = X.shape[1]
-    _NN_MODEL = NearestNeighbors(n_neighbors=min(10, X.shape[0]), metric='cosine').fit(X)
-    _INDEX = (_NN_MODEL, X)
+    _INDEX = TopKIndex(X)
     return
 
+def _encode_uncached(queries: List[str]):
+    if _EMB_METHOD.startswith("sentence"):
+        embs = _ST_MODEL.encode(queries, convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(embs, dtype='float32')
+    return _TFIDF_VECT.transform(queries)
+
+
 def _encode_queries(queries: List[str]):
     """
-    Returns numpy array (n, d) depending on chosen method
+    Returns numpy array (n, d) depending on chosen method.
+    Only queries missing from the embedding cache are encoded (in one call).
     """
     global _EMB_METHOD, _ST_MODEL, _TFIDF_VECT
     if _EMB_METHOD is None:
         build_index()
+
+    unique = list(dict.fromkeys(queries))
+    found = {q: _EMB_CACHE.get(q) for q in unique}
+    missing = [q for q in unique if found[q] is None]
+    if missing:
+        fresh = _encode_uncached(missing)
+        for j, q in enumerate(missing):
+            found[q] = fresh[j:j + 1].copy()
+            _EMB_CACHE.put(q, found[q])
+        if len(missing) == len(queries):
+            # nothing cached and no duplicates: rows are already in order
+            return fresh
+
+    rows = [found[q] for q in queries]
+
     if _EMB_METHOD.startswith("sentence"):
-        embs = _ST_MODEL.encode(queries, convert_to_numpy=True, show_progress_bar=False)
-        return np.asarray(embs, dtype='float32')
-    else:
-        # _INDEX stores TFIDF in second pos for fallback
-        Xq = _TFIDF_VECT.transform(queries)
-        return Xq
+        return np.vstack(rows)
+    from scipy.sparse import vstack as sparse_vstack
+    return sparse_vstack(rows).tocsr()
 
-def search_similar_by_text(query_text: str, top_k: int = 3):
+
+def cache_stats() -> Dict[str, Any]:
+    return {"embeddings": _EMB_CACHE.stats(), "results": _RESULT_CACHE.stats()}
+
+
+def mask_unavailable(I: np.ndarray, D: np.ndarray, available: np.ndarray, k: int):
     """
-    Returns list of item meta for top_k similar items to the query_text
+    Drops sold-out rows from over-fetched (indices, scores) in one pass:
+    available hits move to the front in score order, the rest become -1.
     """
-    global _INDEX, _ITEM_IDS, _ITEM_META, _EMB_METHOD, _FAISS_INDEX, _NN_MODEL
+    keep = (I >= 0) & available[np.maximum(I, 0)]
+    order = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+    I = np.take_along_axis(np.where(keep, I, -1), order, axis=1)
+    D = np.take_along_axis(np.where(keep, D, -np.inf).astype(D.dtype), order, axis=1)
+    return I, D
 
+
+def search_rows(query_texts: List[str], top_k: int, available_only: bool = True):
+    """
+    Raw search: (indices, scores) arrays of shape (n_queries, k), best
+    first, scores being cosine similarities. Rows index into _ITEM_META.
+    With available_only, sold-out items (see inventory.py) are masked out
+    and their slots filled from an over-fetch; a -1 index marks an empty slot.
+    """
+    build_index()
+    k = min(top_k, len(_ITEM_META))
+    qv = _encode_queries(query_texts)
+
+    available, unavailable = inventory.bitmap(_ITEM_IDS) if available_only else (None, 0)
+    # over-fetch by the number of sold-out rows so k available ones survive the mask
+    fetch = min(k + unavailable, len(_ITEM_META))
+
+    if _EMB_METHOD == "sentence-faiss":
+        qv = l2_normalize(qv)
+        D, I = _FAISS_INDEX.search(qv, fetch)
+    else:
+        I, D = _INDEX.search(qv, fetch)
+
+    if unavailable:
+        I, D = mask_unavailable(I, D, available, k)
+    return I, D
+
+
+def search_with_scores(query_texts: List[str], top_k: int = 3) -> List[List[Tuple[Dict[str, Any], float]]]:
+    """
+    Batched search: encodes all queries in one encode/transform call and runs
+    one FAISS search / matrix product. Returns one list of (item meta,
+    similarity) per query.
+    """
     if _INDEX is None:
         build_index()
 
-    # If FAISS index exists
-    if FAISS_AVAILABLE and _EMB_METHOD == "sentence-faiss":
-        qv = _ST_MODEL.encode([query_text], convert_to_numpy=True, show_progress_bar=False).astype('float32')
-        D, I = _FAISS_INDEX.search(qv, top_k)
-        results = []
-        for idx in I[0]:
-            results.append(_ITEM_META[idx])
-        return results
-
-    # If sentence-nn or tfidf-nn fallback using sklearn
-    if _EMB_METHOD in ("sentence-nn", "tfidf-nn"):
-        qv = _encode_queries([query_text])
-        nn_model = _INDEX[0]
-        X_store = _INDEX[1]
-        # Note: scikit expects 2D arrays; for sparse TFIDF, qv is sparse matrix
-        distances, indices = nn_model.kneighbors(qv, n_neighbors=min(top_k, len(_ITEM_META)))
-        results = []
-        for idx in indices[0]:
-            results.append(_ITEM_META[idx])
-        return results
-
-    # final fallback: return top menu entries
-    return _ITEM_META[:top_k]
+    if not query_texts:
+        return []
+
+    # identical queries in one batch (same cart + daypart) are searched once;
+    # the inventory version in the key retires results when an item is 86ed
+    version = inventory.version
+    unique = list(dict.fromkeys(query_texts))
+    found = {q: _RESULT_CACHE.get((q, top_k, version)) for q in unique}
+    missing = [q for q in unique if found[q] is None]
+    if missing:
+        I, D = search_rows(missing, top_k)
+        for q, idx_row, score_row in zip(missing, I, D):
+            res = [
+                (_ITEM_META[idx], float(score))
+                for idx, score in zip(idx_row, score_row)
+                if idx >= 0
+            ]
+            found[q] = res
+            _RESULT_CACHE.put((q, top_k, version), res)
+
+    return [list(found[q]) for q in query_texts]
+
+
+def search_similar_by_texts(query_texts: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+    """
+    Batched search returning one list of item meta per query (no scores).
+    """
+    return [[meta for meta, _ in res] for res in search_with_scores(query_texts, top_k)]
+
+
+def search_similar_by_text(query_text: str, top_k: int = 3):
+    """
+    Returns list of item meta for top_k similar items to the query_text
+    """
+    return search_similar_by_texts([query_text], top_k=top_k)[0]
@@ -5,11 +5,77 @@ reclog = get_logger("recommender")
 
 import time
 from typing import List, Dict, Any
-from .vector_index import build_index, search_similar_by_text
-from .data_loader import load_menu
+from .rules import hour_of
+from .vector_index import search_similar_by_texts, search_with_scores, item_meta
+from .reranker import RERANK_ENABLED, RERANK_CANDIDATES, rerank
+from .cooccurrence import cooccurrence, COOCCURRENCE_MIN_CONFIDENCE
+
+# the index is built by the app's background warmup, or lazily by the first search
+
+
+# (start_hour, end_hour inclusive, daypart); anything else is late_night
+DAYPARTS = [
+    (5, 10, "breakfast"),
+    (11, 15, "lunch"),
+    (16, 21, "dinner"),
+]
+
+
+def daypart(timestamp: str | None) -> str:
+    """
+    Buckets a timestamp into a daypart so queries differing only in the
+    exact time share cache entries.
+    """
+    hour = hour_of(timestamp)
+    for start, end, name in DAYPARTS:
+        if start <= hour <= end:
+            return name
+    return "late_night"
+
+
+def _build_query_text(profile: str, timestamp: str | None, context_ticket_items: List[str] | None) -> str:
+    parts = [f"profile: {profile}"]
+
+    if context_ticket_items:
+        # order-insensitive so the same cart always maps to the same query
+        parts.append("contains: " + " ".join(sorted(set(context_ticket_items))))
+
+    if timestamp:
+        parts.append(f"time: {daypart(timestamp)}")
+
+    return " | ".join(parts) if parts else "recommended items"
+
+
+def _search(query_texts: List[str], contexts: List[Dict[str, Any]], top_k: int) -> List[List[Dict[str, Any]]]:
+    """Vector search, re-ranked with the business rules unless RERANK_ENABLED=0."""
+    if not RERANK_ENABLED:
+        return search_similar_by_texts(query_texts, top_k=top_k)
+    candidates = search_with_scores(query_texts, top_k=max(top_k, RERANK_CANDIDATES))
+    return rerank(candidates, contexts, item_meta(), top_k=top_k)
+
+
+def _explain(results: List[Dict[str, Any]], context_ticket_items: List[str] | None) -> List[Dict[str, Any]]:
+    learned = cooccurrence.complements(context_ticket_items) if context_ticket_items else {}
+    out = []
+    for r in results:
+        reason = "Matches your context"
+        if learned.get(r["id"], 0.0) >= COOCCURRENCE_MIN_CONFIDENCE or (
+            context_ticket_items
+            and any(
+                ci in r.get("tags", [])
+                or ci == r["id"]
+                for ci in context_ticket_items
+            )
+        ):
+            reason = "Complements your order"
+
+        out.append({
+            "id": r["id"],
+            "name": r["name"],
+            "reason": reason
+        })
+    return out
 
-# ensure index built at import
-build_index()
 
 def get_recommendations_vector(
     user: str = "anonymous",
@@ -19,7 +85,8 @@ def get_recommendations_vector(
     top_k: int = 3
 ) -> List[Dict[str, Any]]:
     """
-    Vector-based semantic recommendation using FAISS or fallback.
+    Vector-based semantic recommendation using FAISS or fallback,
+    re-ranked with the rule scores (see reranker.py).
     """
 
     start_time = time.time()
@@ -39,27 +106,23 @@ def get_recommendations_vector(
             }
         )
 
-        menu = load_menu()
-
         # ------------------------------
         # Build natural language query
         # ------------------------------
-        parts = [f"profile: {profile}"]
-
-        if context_ticket_items:
-            parts.append("contains: " + " ".join(context_ticket_items))
-
-        if timestamp:
-            parts.append(f"time: {timestamp}")
-
-        query_text = " | ".join(parts) if parts else "recommended items"
+        query_text = _build_query_text(profile, timestamp, context_ticket_items)
 
         reclog.info("Constructed query", extra={"query_text": query_text})
 
         # ------------------------------
         # Vector search
         # ------------------------------
-        results = search_similar_by_text(query_text, top_k=top_k)
+        context = {
+            "user": user,
+            "profile": profile,
+            "timestamp": timestamp,
+            "context_ticket_items": context_ticket_items,
+        }
+        results = _search([query_text], [context], top_k)[0]
 
         reclog.info(
             "Vector search complete",
@@ -69,24 +132,7 @@ def get_recommendations_vector(
         # ------------------------------
         # Build response with explanation
         # ------------------------------
-        out = []
-        for r in results:
-            reason = "Matches your context"
-            if (
-                context_ticket_items
-                and any(
-                    ci in r.get("tags", [])
-                    or ci == r["id"]
-                    for ci in context_ticket_items
-                )
-            ):
-                reason = "Complements your order"
-
-            out.append({
-                "id": r["id"],
-                "name": r["name"],
-                "reason": reason
-            })
+        out = _explain(results, context_ticket_items)
 
         # ------------------------------
         # Final timing + output log
@@ -106,3 +152,45 @@ def get_recommendations_vector(
     except Exception as e:
         reclog.exception("Recommender failed", extra={"error": str(e)})
         return []
+
+
+def get_recommendations_vector_batch(
+    requests: List[Dict[str, Any]],
+    top_k: int = 3
+) -> List[List[Dict[str, Any]]]:
+    """
+    Batched variant: each request is a dict with the keyword arguments of
+    get_recommendations_vector (profile, timestamp, context_ticket_items).
+    All queries are encoded and searched in a single call.
+    """
+
+    start_time = time.time()
+
+    try:
+        query_texts = [
+            _build_query_text(
+                r.get("profile", "returning"),
+                r.get("timestamp"),
+                r.get("context_ticket_items"),
+            )
+            for r in requests
+        ]
+
+        batch_results = _search(query_texts, requests, top_k)
+
+        out = [
+            _explain(results, r.get("context_ticket_items"))
+            for r, results in zip(requests, batch_results)
+        ]
+
+        latency_ms = round((time.time() - start_time) * 1000, 2)
+        reclog.info(
+            "Batch recommendation complete",
+            extra={"latency_ms": latency_ms, "batch_size": len(requests)}
+        )
+
+        return out
+
+    except Exception as e:
+        reclog.exception("Batch recommender failed", extra={"error": str(e)})
+        return [[] for _ in requests]
@@ -1,15 +1,14 @@
+from db import get_conn, transaction
+
 def init_user_table():
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        phone TEXT UNIQUE,
-        profile TEXT
-    )
-    """)
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone TEXT UNIQUE,
+            profile TEXT
+        )
+        """)
 
 init_user_table()
 
@@ -18,11 +17,9 @@ class LoginRequest(BaseModel):
 
 @app.post("/auth/login")
 def login(req: LoginRequest):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("SELECT phone, profile FROM users WHERE phone = ?", (req.phone,))
-    row = cur.fetchone()
-    conn.close()
+    row = get_conn().execute(
+        "SELECT phone, profile FROM users WHERE phone = ?", (req.phone,)
+    ).fetchone()
 
     if row:
         return {"exists": True, "phone": row[0], "profile": row[1]}
@@ -34,13 +31,8 @@ class RegisterRequest(BaseModel):
 
 @app.post("/auth/register")
 def register(req: RegisterRequest):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-
-    cur.execute("INSERT INTO users (phone, profile) VALUES (?, ?)",
-        (req.phone, req.profile))
-
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute("INSERT INTO users (phone, profile) VALUES (?, ?)",
+            (req.phone, req.profile))
 
     return {"status": "success", "phone": req.phone, "profile": req.profile}
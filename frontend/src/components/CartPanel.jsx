@@ -21,6 +21,7 @@ export default function CartPanel({ cart = [], onCartUpdated = () => {}, onOrder
         body: JSON.stringify({
           profile,
           items: cart.map((c) => c.id),
+          user: user?.phone || null,
         }),
       });
 
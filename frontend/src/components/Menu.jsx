@@ -67,7 +67,8 @@ export default function Menu({ user, onTicketCreated, onCartUpdated }) {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
           profile: profileToUse,
-          items: cart
+          items: cart,
+          user: user?.phone || null
         })
       });
 